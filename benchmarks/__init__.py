@@ -0,0 +1 @@
+"""对话分段PRO 的离线性能测试，无需运行中的 AstrBot，使用 `python -m benchmarks.<name>` 执行。"""
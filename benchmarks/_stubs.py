@@ -0,0 +1,222 @@
+"""
+最小化的 AstrBot 接口替身：仅在本机未安装 AstrBot 时注入，
+让 benchmarks 可以直接导入插件的 main.py。
+另提供各测试共用的假 Context / 结果 / 事件与事件循环滞后探测协程。
+"""
+import sys
+import enum
+import time
+import types
+import random
+import asyncio
+import logging
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class BaseMessageComponent:
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.__dict__)
+
+
+class Plain(BaseMessageComponent):
+    def __init__(self, text: str = ""):
+        self.text = text
+
+
+class Image(BaseMessageComponent):
+    def __init__(self, file: str = ""):
+        self.file = file
+
+
+class At(BaseMessageComponent):
+    def __init__(self, qq: str = ""):
+        self.qq = qq
+
+
+class Face(BaseMessageComponent):
+    def __init__(self, id: int = 0):
+        self.id = id
+
+
+class Reply(BaseMessageComponent):
+    def __init__(self, id: str = ""):
+        self.id = id
+
+
+class Record(BaseMessageComponent):
+    def __init__(self, file: str = "", url: str = ""):
+        self.file = file
+        self.url = url
+
+
+class MessageChain:
+    def __init__(self, chain=None):
+        self.chain = chain or []
+
+
+class _Filter:
+    class EventMessageType:
+        ALL = "ALL"
+
+    class PermissionType:
+        ADMIN = "ADMIN"
+
+    def __getattr__(self, name):
+        def factory(*args, **kwargs):
+            return lambda func: func
+        return factory
+
+
+class Star:
+    def __init__(self, context):
+        self.context = context
+
+
+class SessionServiceManager:
+    @staticmethod
+    async def should_process_tts_request(event) -> bool:
+        return True
+
+
+def install() -> None:
+    """若无法导入真实的 astrbot，则注册替身模块。"""
+    try:
+        import astrbot.api  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    def module(name: str) -> types.ModuleType:
+        mod = types.ModuleType(name)
+        sys.modules[name] = mod
+        return mod
+
+    module("astrbot")
+    api = module("astrbot.api")
+    event = module("astrbot.api.event")
+    star = module("astrbot.api.star")
+    provider = module("astrbot.api.provider")
+    components = module("astrbot.api.message_components")
+    module("astrbot.core")
+    module("astrbot.core.star")
+    session = module("astrbot.core.star.session_llm_manager")
+
+    api.AstrBotConfig = dict
+    api.logger = logging.getLogger("astrbot")
+    event.filter = _Filter()
+    event.AstrMessageEvent = object
+    event.MessageChain = MessageChain
+    star.Context = object
+    star.Star = Star
+    provider.LLMResponse = object
+    provider.ProviderRequest = object
+    for cls in (BaseMessageComponent, Plain, Image, At, Face, Reply, Record):
+        setattr(components, cls.__name__, cls)
+    session.SessionServiceManager = SessionServiceManager
+
+
+def load_plugin():
+    """以独立模块名加载仓库根目录的 main.py。"""
+    install()
+    if "splitter_main" in sys.modules:
+        return sys.modules["splitter_main"]
+    spec = importlib.util.spec_from_file_location("splitter_main", ROOT / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["splitter_main"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeContext:
+    """
+    假的 Context：send_message 耗时 latency 秒（按 ±jitter 比例随机浮动），以 failure_rate 的概率抛出异常模拟发送失败，
+    成功时计数、按需记录消息链（record）并回调 on_sent(umo, chain)。
+    tts_provider 不为空时视为已启用 TTS。
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, rnd: random.Random = None,
+                 record: bool = True, tts_provider=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rnd = rnd or random.Random(0)
+        self.record = record
+        self.tts_provider = tts_provider
+        self.sent = []
+        self.delivered = 0
+        self.failures = 0
+        self.on_sent = None
+
+    async def send_message(self, umo, chain):
+        if self.latency: await asyncio.sleep(self.latency * self.rnd.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.failure_rate and self.rnd.random() < self.failure_rate:
+            self.failures += 1
+            raise RuntimeError("simulated send failure")
+        self.delivered += 1
+        if self.record: self.sent.append(chain.chain)
+        if self.on_sent is not None: self.on_sent(umo, chain.chain)
+
+    def get_config(self, umo=None):
+        return {"provider_tts_settings": {"enable": self.tts_provider is not None}}
+
+    def get_using_tts_provider(self, umo=None):
+        return self.tts_provider
+
+
+ResultContentType = enum.Enum("ResultContentType", "LLM_RESULT GENERAL_RESULT STREAMING_RESULT STREAMING_FINISH")
+
+
+class FakeResult:
+    def __init__(self, chain, llm: bool = True, content_type: ResultContentType = None, async_stream=None):
+        self.chain = chain
+        self.llm = llm
+        self.result_content_type = content_type
+        self.async_stream = async_stream
+
+    def is_model_result(self):
+        return self.llm
+
+
+class FakeEvent:
+    """假的消息事件；chain 为 None 时没有结果（用于 on_message 等入站钩子）。"""
+
+    def __init__(self, chain=None, umo: str = "bench:GroupMessage:1", message_id: str = "1", group_id="1",
+                 sender: str = "u", platform: str = "bench", llm: bool = True):
+        self.unified_msg_origin = umo
+        self.message_obj = SimpleNamespace(message_id=message_id, group_id=group_id)
+        self._sender = sender
+        self._platform = platform
+        self._result = FakeResult(chain, llm) if chain is not None else None
+
+    def get_result(self):
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+
+    def get_platform_name(self):
+        return self._platform
+
+    def get_self_id(self):
+        return "bot"
+
+    def get_sender_id(self):
+        return self._sender
+
+
+async def lag_probe(lags: list, stop: asyncio.Event, interval: float = 0.001) -> None:
+    """每隔 interval 秒醒来一次，记录实际醒来时间的滞后，直到 stop 被设置。"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+def percentile(values, q: float):
+    """取 values 的 q 分位数（0 ≤ q ≤ 1，按最近秩）。"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
@@ -0,0 +1,96 @@
+"""
+智能回复会话记录的内存与查询耗时测试。
+
+    python -m benchmarks.bench_conversations [--conversations 100000] [--messages 5] [--cap 10000] [--rules 500]
+
+对比旧版 defaultdict(deque) 结构与 ConversationTracker（不限量 / 限量）在
+大量会话下的常驻内存，以及“判断是否被插嘴”的单次查询耗时；
+另测按会话配置方案规则解析生效配置的耗时（逐条匹配规则 vs ProfileRouter）。
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+from ._stubs import load_plugin
+
+
+def _legacy_fill(conversations: int, messages: int):
+    queues = defaultdict(deque)
+    marks = {}
+    for c in range(conversations):
+        key = "aiocqhttp:GroupMessage:{}".format(c)
+        queue = queues[key]
+        for m in range(messages):
+            queue.append(str(c * messages + m))
+            if len(queue) > 200: queue.popleft()
+        mark = "__bot_reply__{}".format(c * messages)
+        queue.append(mark)
+        marks[key] = mark
+    return queues, marks
+
+
+def _tracker_fill(tracker, conversations: int, messages: int):
+    for c in range(conversations):
+        key = "aiocqhttp:GroupMessage:{}".format(c)
+        for m in range(messages):
+            tracker.record_message(key, str(c * messages + m))
+        tracker.record_reply(key, "__bot_reply__{}".format(c * messages))
+    return tracker
+
+
+def _measure(label: str, build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<28} 常驻 {:>8.1f} MB  峰值 {:>8.1f} MB  写入 {:>6.2f} s".format(label, current / 2**20, peak / 2**20, elapsed))
+    return obj
+
+
+def _lookup_cost(label: str, lookup, rounds: int = 20000):
+    start = time.perf_counter()
+    for _ in range(rounds): lookup()
+    per_call = (time.perf_counter() - start) / rounds
+    print("{:<28} 单次查询 {:>8.2f} µs".format(label, per_call * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--cap", type=int, default=10000)
+    parser.add_argument("--rules", type=int, default=500, help="按会话指定配置方案的规则条数")
+    args = parser.parse_args()
+    plugin = load_plugin()
+
+    print("会话数 {}，每会话消息 {}".format(args.conversations, args.messages))
+    _measure("legacy defaultdict(deque)", lambda: _legacy_fill(args.conversations, args.messages))
+    _measure("tracker 不限量", lambda: _tracker_fill(plugin.ConversationTracker(0, 0), args.conversations, args.messages))
+    tracker = _measure("tracker 上限 {}".format(args.cap), lambda: _tracker_fill(plugin.ConversationTracker(args.cap, 0), args.conversations, args.messages))
+    print("限量后保留会话数: {}".format(len(tracker)))
+
+    # 满队列（200 条）时查询最早一条消息
+    queue = deque(str(i) for i in range(200))
+    _lookup_cost("legacy 线性查找", lambda: (lambda q: len(q) - q.index("0") - 1)([str(x) for x in queue]))
+    deep = plugin.ConversationTracker(0, 0)
+    for i in range(200): deep.record_message("k", str(i))
+    _lookup_cost("tracker 序号相减", lambda: deep.pushed_after("k", "0"))
+
+    # 配置方案路由：每个群一条规则，查询最后一条规则对应的会话
+    get_cfg = lambda key, default=None: default
+    profiles = {"p{}".format(i): plugin.SplitterSettings.build(get_cfg, plugin.PatternRegistry()) for i in range(8)}
+    rules = ["aiocqhttp:GroupMessage:{}=p{}".format(c, c % 8) for c in range(args.rules)]
+    umo = "aiocqhttp:GroupMessage:{}".format(args.rules - 1)
+    parsed = [rule.rpartition("=") for rule in rules]
+    _lookup_cost("规则逐条匹配 ({} 条)".format(args.rules), lambda: next(profiles[name] for cond, _, name in parsed if cond == umo))
+    router = plugin.ProfileRouter(profiles["p0"], profiles, tuple(rules))
+    _lookup_cost("ProfileRouter ({} 条)".format(args.rules), lambda: router.resolve(umo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+并发会话压测：按设定速率为大量会话生成消息，依次经过插件的 on_message 与 on_decorating_result，
+假的 send_message 模拟发送耗时与失败，统计整体表现。
+
+    python -m benchmarks.bench_load [--conversations 2000] [--rate 200] [--duration 10]
+                                    [--send-latency 20] [--failure-rate 0.01] [--delay 0.2] [--sync]
+
+输出：
+- 分段端到端延迟：从回复进入装饰阶段到该段发送完成（含分段间隔与排队），p50/p99/最大；
+- 事件循环滞后：每毫秒醒来一次的探测协程的滞后分位数；
+- on_message 记录耗时与会话记录数；
+- 常驻内存（RSS）增长与 Python 堆增长（--trace-memory 时统计，会拖慢整体速度）；
+- 乱序：同一会话中后发出的分段属于更早的回复或更早的句子的次数。
+  后台发送按会话排队，应为 0；--sync 时同一会话的两条回复会在装饰阶段内交错发送，乱序不为 0。
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import re
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from ._stubs import FakeContext, FakeEvent, lag_probe, load_plugin, percentile
+from .corpus import EN_SENTENCES, ZH_SENTENCES
+
+# 每句开头的标记：〔回复序号-句序号〕，发送后据此检查顺序与计算延迟
+_MARK_RE = re.compile(r"〔(\d+)-(\d+)〕")
+
+
+def _percentiles(values, scale=1.0):
+    if not values: return "-"
+    return "p50 {:.2f}  p99 {:.2f}  最大 {:.2f}".format(
+        percentile(values, 0.5) * scale, percentile(values, 0.99) * scale, max(values) * scale)
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+class LoadStats:
+    def __init__(self):
+        self.reply_start = {}
+        self.last_mark = {}
+        self.latencies = []
+        self.violations = 0
+        self.segments = 0
+        self.on_message = []
+        self.lags = []
+
+    def sent(self, umo, chain) -> None:
+        now = time.perf_counter()
+        text = "".join(getattr(c, "text", "") for c in chain)
+        for m in _MARK_RE.finditer(text):
+            mark = (int(m.group(1)), int(m.group(2)))
+            if mark < self.last_mark.get(umo, (-1, -1)): self.violations += 1
+            else: self.last_mark[umo] = mark
+            self.segments += 1
+            self.latencies.append(now - self.reply_start[mark[0]])
+
+
+def _reply_text(rnd: random.Random, reply: int) -> str:
+    pool = ZH_SENTENCES + EN_SENTENCES
+    return "".join("〔{}-{}〕{}".format(reply, k, rnd.choice(pool)) for k in range(rnd.randint(1, 6)))
+
+
+async def _handle(plugin, ctx: FakeContext, stats: LoadStats, umo: str, reply: int, group: bool, rnd: random.Random) -> None:
+    group_id = "g" if group else None
+    incoming = FakeEvent(umo=umo, message_id="m{}".format(reply), group_id=group_id, sender="u{}".format(reply % 97), platform="aiocqhttp")
+    start = time.perf_counter()
+    await plugin.on_message(incoming)
+    stats.on_message.append(time.perf_counter() - start)
+
+    event = FakeEvent([plugin_plain(_reply_text(rnd, reply))], umo=umo, message_id="m{}".format(reply), group_id=group_id, platform="aiocqhttp")
+    stats.reply_start[reply] = time.perf_counter()
+    await plugin.on_decorating_result(event)
+    # 留在结果链中的最后一段由框架发送
+    chain = event.get_result().chain
+    if chain:
+        try:
+            await ctx.send_message(umo, SimpleNamespace(chain=list(chain)))
+        except RuntimeError:
+            pass
+
+
+plugin_plain = None
+
+
+async def _run(plugin_mod, args) -> None:
+    rnd = random.Random(args.seed)
+    ctx = FakeContext(args.send_latency / 1e3, jitter=0.5, failure_rate=args.failure_rate, rnd=rnd, record=False)
+    stats = LoadStats()
+    ctx.on_sent = stats.sent
+    config = {
+        "split_scope": "all", "split_regex": "[。？！?!\n…]+", "async_delivery": not args.sync,
+        "delay_strategy": "fixed", "fixed_delay": args.delay, "enable_tts_for_segments": False,
+        "max_tracked_conversations": args.conversations, "send_retry_backoff": 0.05,
+        "enable_smart_reply": True,
+    }
+    plugin = plugin_mod.MessageSplitterPlugin(ctx, config)
+
+    gc.collect()
+    if args.trace_memory: tracemalloc.start()
+    rss_before = _rss_mb()
+    heap_before = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(lag_probe(stats.lags, stop))
+    tasks = set()
+    total = int(args.rate * args.duration)
+    start = time.perf_counter()
+    for reply in range(total):
+        # 按设定总速率均匀产生消息，每条随机落到某个会话
+        due = start + reply / args.rate
+        now = time.perf_counter()
+        if due > now: await asyncio.sleep(due - now)
+        c = rnd.randrange(args.conversations)
+        umo = "aiocqhttp:{}:{}".format("GroupMessage" if c % 3 else "FriendMessage", c)
+        task = asyncio.create_task(_handle(plugin, ctx, stats, umo, reply, c % 3 != 0, rnd))
+        tasks.add(task); task.add_done_callback(tasks.discard)
+    produced = time.perf_counter() - start
+    if tasks: await asyncio.gather(*tasks)
+    await plugin.terminate()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    rss_after = _rss_mb()
+    heap_after = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+    if args.trace_memory: tracemalloc.stop()
+
+    print("会话 {}  消息 {}（{:.0f} 条/s，实际 {:.0f} 条/s）  模式 {}".format(
+        args.conversations, total, args.rate, total / produced if produced else 0.0, "同步" if args.sync else "后台发送"))
+    print("发送 {} 段（失败 {} 次），全部处理完成耗时 {:.2f} s".format(ctx.delivered, ctx.failures, elapsed))
+    print("分段端到端延迟 (ms): {}".format(_percentiles(stats.latencies, 1e3)))
+    print("事件循环滞后 (ms):   {}".format(_percentiles(stats.lags, 1e3)))
+    print("on_message (µs):     {}".format(_percentiles(stats.on_message, 1e6)))
+    print("会话记录 {} 个  常驻内存 {:+.1f} MB{}".format(
+        len(plugin._conversations), rss_after - rss_before,
+        "  Python 堆 {:+.1f} MB".format((heap_after - heap_before) / 2**20) if args.trace_memory else ""))
+    print("乱序 {} 次（检查 {} 段）".format(stats.violations, stats.segments))
+
+
+def main():
+    global plugin_plain
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="所有会话合计每秒消息数")
+    parser.add_argument("--duration", type=float, default=10, help="产生消息的时长（秒）")
+    parser.add_argument("--send-latency", type=float, default=20, help="单次发送平均耗时（毫秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="单次发送失败概率")
+    parser.add_argument("--delay", type=float, default=0.2, help="分段间隔（秒，固定延迟）")
+    parser.add_argument("--sync", action="store_true", help="关闭后台发送，在装饰阶段内逐段发送")
+    parser.add_argument("--trace-memory", action="store_true", help="用 tracemalloc 统计 Python 堆增长")
+    parser.add_argument("--seed", type=int, default=20260417)
+    args = parser.parse_args()
+    plugin_mod = load_plugin()
+    plugin_plain = plugin_mod.Plain
+    plugin_mod.logger.setLevel("ERROR")
+    asyncio.run(_run(plugin_mod, args))
+
+
+if __name__ == "__main__":
+    main()
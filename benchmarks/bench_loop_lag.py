@@ -0,0 +1,79 @@
+"""
+事件循环延迟测试：处理一条超长回复的同时，另一个协程按固定间隔醒来，统计其实际醒来时间的滞后。
+
+    python -m benchmarks.bench_loop_lag [--chars 200000] [--interval 1] [--max-ratio 0.5]
+
+分别以“不卸载”（在事件循环内切分）、线程池、进程池三种方式处理同一条回复。
+卸载生效时，最大滞后应明显小于整条回复的处理耗时，说明其他对话在切分期间仍能得到调度：
+线程池或进程池的最大滞后超过同模式下“不卸载”处理耗时的 max-ratio 倍即以退出码 1 结束。
+回复过短时切分耗时与调度抖动相当，检查没有意义，应保持默认字数。
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from ._stubs import FakeContext, FakeEvent, lag_probe, load_plugin
+from .corpus import EN_SENTENCES, ZH_SENTENCES, _sentences
+
+BASE_CONFIG = {
+    "split_scope": "all", "split_regex": "[。？！?!\n…]+", "async_delivery": False,
+    "delay_strategy": "fixed", "fixed_delay": 0, "enable_tts_for_segments": False,
+    "clean_before_regex": "<think>.*?</think>",
+}
+MODES = {
+    "不卸载": {"offload_threshold": 0},
+    "线程池": {"offload_threshold": 1, "offload_executor": "thread"},
+    "进程池": {"offload_threshold": 1, "offload_executor": "process"},
+}
+
+
+async def _run(plugin_mod, text: str, config: dict, args):
+    plugin = plugin_mod.MessageSplitterPlugin(FakeContext(record=False), dict(BASE_CONFIG, **config))
+    # 预热：进程池/线程池的创建不计入
+    await plugin.on_decorating_result(FakeEvent([plugin_mod.Plain(text[:2000])]))
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(lag_probe(lags, stop, args.interval / 1e3))
+    await asyncio.sleep(args.interval / 1e3 * 3)
+    elapsed = []
+    for _ in range(args.repeat):
+        lags.clear()
+        start = time.perf_counter()
+        await plugin.on_decorating_result(FakeEvent([plugin_mod.Plain(text)]))
+        elapsed.append(time.perf_counter() - start)
+    stop.set()
+    await ticker
+    await plugin.terminate()
+    return statistics.median(elapsed), max(lags, default=0.0), statistics.median(lags) if lags else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=200000, help="超长回复的字数")
+    parser.add_argument("--interval", type=float, default=1.0, help="探测协程的唤醒间隔（毫秒）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ratio", type=float, default=0.5, help="卸载时最大滞后 / 不卸载时处理耗时 的上限")
+    args = parser.parse_args()
+    plugin_mod = load_plugin()
+    rnd = random.Random(20260417)
+    text = "<think>" + _sentences(rnd, ZH_SENTENCES, 2000) + "</think>\n" + _sentences(rnd, ZH_SENTENCES + EN_SENTENCES, args.chars)
+
+    inline = {}; failed = []
+    for label, config in MODES.items():
+        for balanced in (False, True):
+            cfg = dict(config, balanced_split_mode=balanced)
+            took, worst, typical = asyncio.run(_run(plugin_mod, text, cfg, args))
+            kind = "均分" if balanced else "普通"
+            print("{:<6} {:<8} 处理耗时 {:>8.1f} ms  最大滞后 {:>8.2f} ms  滞后中位数 {:>6.2f} ms".format(
+                label, kind, took * 1e3, worst * 1e3, typical * 1e3))
+            if not config["offload_threshold"]: inline[balanced] = took
+            elif worst > inline[balanced] * args.max_ratio: failed.append("{} {}".format(label, kind))
+    if failed:
+        print("卸载后最大滞后未明显小于不卸载时的处理耗时（上限 {:.0%}）: {}".format(args.max_ratio, ", ".join(failed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
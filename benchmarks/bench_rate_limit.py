@@ -0,0 +1,85 @@
+"""
+发送限速测试：模拟平台每秒只接受固定条数，超出即报错，对比开启/关闭限速时的送达情况。
+
+    python -m benchmarks.bench_rate_limit [--ceiling 20] [--conversations 20] [--segments 5] [--min-ratio 0.8]
+
+关闭限速且不重试时，突发的分段会因平台限流直接丢失；开启限速后应全部送达，
+吞吐接近平台上限，并输出排队等待耗时。
+开启限速的一轮有分段丢失，或吞吐低于平台上限的 min-ratio 倍时，以退出码 1 结束。
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from ._stubs import FakeContext, FakeEvent, load_plugin
+
+BASE_CONFIG = {
+    "split_scope": "all", "split_regex": "[。？！?!\n…]+", "async_delivery": True,
+    "delay_strategy": "fixed", "fixed_delay": 0, "enable_tts_for_segments": False,
+    "max_concurrent_deliveries": 64, "enable_metrics": True,
+}
+
+
+class RateLimitedContext(FakeContext):
+    """假的 send_message：滑动一秒窗口内超过 ceiling 条即抛出限流异常。"""
+
+    def __init__(self, ceiling: int):
+        super().__init__()
+        self.ceiling = ceiling
+        self.window = []
+        self.rejected = 0
+
+    async def send_message(self, umo, chain):
+        await asyncio.sleep(0)
+        now = time.monotonic()
+        self.window = [t for t in self.window if now - t < 1.0]
+        if len(self.window) >= self.ceiling:
+            self.rejected += 1
+            raise RuntimeError("rate limited")
+        self.window.append(now)
+        self.delivered += 1
+
+
+async def _run(plugin_mod, plain, label: str, config: dict, args):
+    """返回 (送达条数, 吞吐 条/s)。"""
+    ctx = RateLimitedContext(args.ceiling)
+    plugin = plugin_mod.MessageSplitterPlugin(ctx, dict(BASE_CONFIG, **config))
+    text = "".join("第{}段。".format(i) for i in range(args.segments))
+    start = time.monotonic()
+    for c in range(args.conversations):
+        await plugin.on_decorating_result(FakeEvent([plain(text)], umo="bench:GroupMessage:{}".format(c), message_id=str(c), group_id=str(c)))
+    await plugin.terminate()
+    elapsed = time.monotonic() - start
+    expected = args.conversations * args.segments
+    wait = plugin._metrics.stages["rate_wait"]
+    throughput = ctx.delivered / elapsed if elapsed else 0.0
+    print("{:<10} 送达 {:>4}/{:<4} 丢失 {:>4} 被限流 {:>4} 耗时 {:>6.2f}s 吞吐 {:>6.1f} 条/s 最长排队 {:>6.2f}s".format(
+        label, ctx.delivered, expected, expected - ctx.delivered, ctx.rejected, elapsed,
+        throughput, wait.max))
+    return ctx.delivered, throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ceiling", type=int, default=20, help="平台每秒允许的条数")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--segments", type=int, default=5, help="每条回复的分段数")
+    parser.add_argument("--min-ratio", type=float, default=0.8, help="开启限速时吞吐至少为平台上限的比例")
+    args = parser.parse_args()
+    plugin_mod = load_plugin()
+    plain = plugin_mod.Plain
+    # 不限速一轮的“发送失败”日志是预期结果，不逐条输出
+    plugin_mod.logger.setLevel(logging.CRITICAL)
+
+    asyncio.run(_run(plugin_mod, plain, "不限速", {"send_rate_limit": 0, "send_retry_times": 0}, args))
+    delivered, throughput = asyncio.run(_run(plugin_mod, plain, "限速", {"send_rate_limit": args.ceiling * 0.95, "send_rate_burst": 1, "send_retry_times": 2, "send_retry_backoff": 0.5}, args))
+    expected = args.conversations * args.segments
+    if delivered < expected or throughput < args.ceiling * args.min_ratio:
+        print("开启限速后应全部送达且吞吐不低于平台上限的 {:.0%}".format(args.min_ratio))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+分段流水线性能测试：清理 -> 切分 -> 合并 -> 后处理 -> 发送（发送为空操作）。
+除延迟与吞吐外还统计“段长CV”（每条回复各段非空白字数的变异系数均值），衡量均分效果。
+
+    python -m benchmarks.bench_split                      # 运行全部模式与语料
+    python -m benchmarks.bench_split --save baseline.json # 保存基线
+    python -m benchmarks.bench_split --compare baseline.json --threshold 0.15
+    python -m benchmarks.bench_split --cache              # 开启切分缓存（重复轮次命中缓存）
+
+对比基线时，任一 (模式, 语料) 的 p50 延迟变慢或吞吐下降超过阈值即以退出码 1 结束，
+可在发版前接入 CI。
+"""
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from ._stubs import FakeContext, FakeEvent, load_plugin, percentile
+from .corpus import build_corpus
+
+MODES = {}
+for _mode, _smart, _balanced in itertools.product(("regex", "simple"), (True, False), (False, True)):
+    MODES["{}{}{}".format(_mode, "+smart" if _smart else "", "+balanced" if _balanced else "")] = {
+        "split_mode": _mode, "enable_smart_split": _smart, "balanced_split_mode": _balanced,
+    }
+BASE_CONFIG = {
+    "split_scope": "all", "split_regex": "[。？！?!\n…]+", "async_delivery": False,
+    "delay_strategy": "fixed", "fixed_delay": 0, "enable_tts_for_segments": False,
+    # 同一语料会重复多轮，默认关闭切分缓存以测量完整流水线
+    "split_cache_size": 0,
+}
+
+
+def _segment_cv(segments):
+    lengths = [sum(len("".join(c.text.split())) for c in seg if hasattr(c, "text")) for seg in segments if seg]
+    if len(lengths) < 2: return None
+    mean = statistics.mean(lengths)
+    return statistics.pstdev(lengths) / mean if mean else None
+
+
+async def _run_case(plugin_mod, mode_cfg, replies, repeat, cache=False):
+    ctx = FakeContext()
+    plugin = plugin_mod.MessageSplitterPlugin(ctx, dict(BASE_CONFIG, **mode_cfg, **({"split_cache_size": 256} if cache else {})))
+    chars = sum(len(c.text) for r in replies for c in r if hasattr(c, "text"))
+    nbytes = sum(len(c.text.encode("utf-8")) for r in replies for c in r if hasattr(c, "text"))
+    latencies = []; cvs = []
+    for _ in range(repeat):
+        events = [FakeEvent(copy.deepcopy(r)) for r in replies]
+        for event in events:
+            start = time.perf_counter()
+            await plugin.on_decorating_result(event)
+            latencies.append(time.perf_counter() - start)
+            # 最后一段留在原结果链中由框架发送
+            cv = _segment_cv(ctx.sent + [event.get_result().chain])
+            if cv is not None: cvs.append(cv)
+            ctx.sent.clear()
+    total = sum(latencies)
+
+    # 单独一轮统计内存峰值，避免 tracemalloc 干扰计时
+    events = [FakeEvent(copy.deepcopy(r)) for r in replies]
+    tracemalloc.start()
+    peak = 0
+    for event in events:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await plugin.on_decorating_result(event)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        ctx.sent.clear()
+    tracemalloc.stop()
+
+    return {
+        "replies_per_s": len(latencies) / total if total else 0.0,
+        "mb_per_s": nbytes * repeat / total / 2**20 if total else 0.0,
+        "p50_ms": statistics.median(latencies) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "peak_kb": peak / 1024,
+        "len_cv": statistics.mean(cvs) if cvs else 0.0,
+        "cache_hits": plugin._split_cache.hits,
+        "chars": chars,
+    }
+
+
+def _compare(results, baseline, threshold):
+    regressions = []
+    for mode, cats in results.items():
+        for cat, cur in cats.items():
+            old = baseline.get(mode, {}).get(cat)
+            if not old: continue
+            if old["p50_ms"] > 0 and cur["p50_ms"] > old["p50_ms"] * (1 + threshold):
+                regressions.append("{}/{}: p50 {:.3f} -> {:.3f} ms".format(mode, cat, old["p50_ms"], cur["p50_ms"]))
+            if old["replies_per_s"] > 0 and cur["replies_per_s"] < old["replies_per_s"] * (1 - threshold):
+                regressions.append("{}/{}: 吞吐 {:.1f} -> {:.1f} 条/s".format(mode, cat, old["replies_per_s"], cur["replies_per_s"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="*", choices=sorted(MODES), help="只运行指定模式")
+    parser.add_argument("--categories", nargs="*", help="只运行指定语料")
+    parser.add_argument("--repeat", type=int, default=3, help="每类语料重复次数")
+    parser.add_argument("--scale", type=float, default=1.0, help="语料条数缩放系数")
+    parser.add_argument("--save", help="将结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与基线 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=0.15, help="允许的性能回退比例")
+    parser.add_argument("--cache", action="store_true", help="开启切分缓存")
+    args = parser.parse_args(argv)
+
+    plugin_mod = load_plugin()
+    components = sys.modules["astrbot.api.message_components"]
+    corpus = build_corpus(components, scale=args.scale)
+    if args.categories:
+        corpus = {k: v for k, v in corpus.items() if k in args.categories}
+    modes = {k: MODES[k] for k in (args.modes or MODES)}
+
+    results = {}
+    header = "{:<24} {:<12} {:>10} {:>9} {:>10} {:>10} {:>10} {:>8}".format("mode", "corpus", "条/s", "MB/s", "p50 ms", "p99 ms", "峰值 KB", "段长CV")
+    print(header)
+    print("-" * len(header))
+    for mode, mode_cfg in modes.items():
+        results[mode] = {}
+        for cat, replies in corpus.items():
+            r = asyncio.run(_run_case(plugin_mod, mode_cfg, replies, args.repeat, args.cache))
+            results[mode][cat] = r
+            print("{:<24} {:<12} {:>10.1f} {:>9.2f} {:>10.3f} {:>10.3f} {:>10.1f} {:>8.3f}".format(
+                mode, cat, r["replies_per_s"], r["mb_per_s"], r["p50_ms"], r["p99_ms"], r["peak_kb"], r["len_cv"]))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print("已保存基线: {}".format(args.save))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = _compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("\n发现性能回退（阈值 {:.0%}）:".format(args.threshold))
+            for line in regressions: print("  " + line)
+            return 1
+        print("\n与基线相比无明显回退（阈值 {:.0%}）".format(args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+分段 TTS 预取测试：假的 TTS 服务每次合成固定耗时，统计一条回复全部分段完成语音转换的总耗时。
+
+    python -m benchmarks.bench_tts [--segments 5] [--latency 200]
+
+按发送顺序对各段依次调用 _process_tts_for_segment（与实际发送相同），对比不同 tts_concurrency：
+逐段合成时总耗时约为各段耗时之和；并发数不小于段数时约为单段耗时（最大值）；
+默认并发数 3 下 5 段约为 ⌈5/3⌉ = 2 倍单段耗时。最后再处理一次相同内容，应全部命中音频缓存。
+并发数不小于段数时总耗时未明显低于各段之和（超过单段耗时的 1.5 倍）即以退出码 1 结束。
+"""
+import argparse
+import asyncio
+import math
+import sys
+import time
+
+from ._stubs import FakeContext, FakeEvent, load_plugin
+
+
+class FakeTTSProvider:
+    """假的 TTS 服务：每次 get_audio 耗时 latency 秒，返回可被缓存复用的音频地址。"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.provider_config = {"id": "fake-tts"}
+        self.calls = 0
+
+    async def get_audio(self, text: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return "https://tts.example/{}.wav".format(self.calls)
+
+
+async def _run(plugin_mod, concurrency: int, args):
+    provider = FakeTTSProvider(args.latency / 1e3)
+    plugin = plugin_mod.MessageSplitterPlugin(FakeContext(tts_provider=provider), {
+        "enable_tts_for_segments": True, "tts_concurrency": concurrency,
+    })
+    event = FakeEvent([])
+    texts = ["第{}段语音内容。".format(i) for i in range(args.segments)]
+    rounds = []
+    for _ in range(2):
+        segments = [plugin_mod.Segment.of_text(t) for t in texts]
+        for seg in segments: seg.measure()
+        start = time.perf_counter()
+        plans = await plugin._start_tts_prefetch(event, segments)
+        for seg, plan in zip(segments, plans):
+            await plugin._process_tts_for_segment(seg.materialize(), plan)
+        rounds.append(time.perf_counter() - start)
+    await plugin.terminate()
+    return rounds[0], rounds[1], provider.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=200, help="单次合成耗时（毫秒）")
+    args = parser.parse_args()
+    plugin_mod = load_plugin()
+    latency = args.latency / 1e3
+
+    failed = False
+    for concurrency in sorted({1, 3, args.segments}):
+        took, cached, calls = asyncio.run(_run(plugin_mod, concurrency, args))
+        expected = math.ceil(args.segments / concurrency) * latency
+        print("并发 {:<3} 总耗时 {:>7.1f} ms（预期约 {:>7.1f} ms，各段之和 {:>7.1f} ms）  再次处理 {:>6.1f} ms  合成 {} 次".format(
+            concurrency, took * 1e3, expected * 1e3, args.segments * latency * 1e3, cached * 1e3, calls))
+        if concurrency >= args.segments and took > latency * 1.5:
+            print("并发数不小于段数时总耗时应约为单段耗时")
+            failed = True
+    if failed: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
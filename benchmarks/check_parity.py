@@ -0,0 +1,99 @@
+"""
+分段结果对照：用 legacy_split 中保留的 1.3.x 逐字符实现与当前扫描器切分同一批语料，逐段比较。
+
+    python -m benchmarks.check_parity [--cases 3000] [--seed 1]
+
+覆盖智能/非智能、正则/简单分隔符模式下的单段文本切分（切分点）与整条消息链切分（含组件策略、
+零宽空格片段、代码块与思维链），不含均分模式（已按设计改为最优划分）。
+有任何不一致即打印前几例并以退出码 1 结束，修改切分逻辑后应保持通过。
+"""
+import argparse
+import random
+import sys
+
+from . import legacy_split
+from ._stubs import load_plugin
+from .corpus import build_corpus
+
+WORDS = [
+    "你好", "今天", "天气", "不错", "hello", "world", "Mr.", "e.g.", "3.14", "“引号”", "（括号）", "(paren)",
+    "《书名》", "'single'", '"double"', "`tick`", "<tag>", "a < b", "```code\nx=1\n```", "<think>想一想。好的！</think>",
+    "。", "！", "？", "?", "!", "\n", "\n\n", "…", "，", ",", "、", "；", ";", " ", "  ", "\u200b \u200b", "\u200b",
+    "【注】", "{json: 1}", "```unclosed", "<think>unclosed", "...", "!?", "a.b", " - ", "end.", "，，；", ";;", "``",
+]
+STRATEGIES = (
+    {"image": "单独", "at": "跟随下段", "face": "嵌入", "default": "跟随下段"},
+    {"image": "跟随上段", "at": "接下文", "face": "单独", "default": "嵌入"},
+)
+
+
+def _patterns(plugin_mod):
+    return [
+        plugin_mod.DEFAULT_SPLIT_REGEX, r"[。；;，]+", r"\n+",
+        plugin_mod._build_simple_pattern(plugin_mod.DEFAULT_SPLIT_CHARS),
+        plugin_mod._build_simple_pattern(["< -- >", ",", "。"]),
+    ]
+
+
+def _random_chain(rnd: random.Random, c):
+    text = "".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 60)))
+    r = rnd.random()
+    if r < 0.2: return [c.Plain(text[:len(text) // 2]), c.Image(file="x"), c.Plain(text[len(text) // 2:])]
+    if r < 0.3: return [c.At(qq="1"), c.Plain(text)]
+    if r < 0.35: return [c.Reply(id="9"), c.Plain(text), c.Face(id=1)]
+    return [c.Plain(text)]
+
+
+def _shape(segments, plain_cls):
+    return [[("text", comp.text) if isinstance(comp, plain_cls) else id(comp) for comp in seg] for seg in segments]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=3000, help="随机消息链条数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    plugin_mod = load_plugin()
+    plugin_mod.logger.setLevel("ERROR")
+    Plain = plugin_mod.Plain
+    components = __import__("astrbot.api.message_components", fromlist=["Plain"])
+    rnd = random.Random(args.seed)
+    chains = [_random_chain(rnd, components) for _ in range(args.cases)]
+    chains += [chain for replies in build_corpus(components).values() for chain in replies]
+
+    plugin = plugin_mod.MessageSplitterPlugin(object(), {})
+    mismatches = []; total = 0
+    for pattern in _patterns(plugin_mod):
+        compiled = plugin_mod.re.compile(pattern)
+        for smart in (True, False):
+            for strategies in STRATEGIES:
+                cfg = plugin_mod.SplitterSettings.build(lambda key, default, s=smart, p=strategies: {
+                    "split_regex": pattern, "enable_smart_split": s, "image_strategy": p["image"], "at_strategy": p["at"],
+                    "face_strategy": p["face"], "other_media_strategy": p["default"],
+                }.get(key, default), plugin._patterns)
+                for chain in chains:
+                    total += 1
+                    # 单段文本的切分点
+                    for comp in chain:
+                        if not isinstance(comp, Plain) or not comp.text: continue
+                        cuts = plugin_mod._scan_smart_cuts(comp.text, compiled) if smart else plugin_mod._delimiter_cuts(compiled, comp.text)
+                        pieces = [comp.text[a:b] for a, b in zip([0] + cuts, cuts + [len(comp.text)]) if b > a]
+                        expected = legacy_split.split_text(comp.text, pattern, smart)
+                        if pieces != expected: mismatches.append((pattern, smart, comp.text, expected, pieces))
+                    # 整条消息链
+                    masked = [Plain(legacy_split.mask_zwsp(comp.text)) if isinstance(comp, Plain) else comp for comp in chain]
+                    old = legacy_split.split_chain(masked, pattern, smart, strategies, cfg.enable_reply or cfg.enable_smart_reply, Plain)
+                    for seg in old:
+                        for comp in seg:
+                            if isinstance(comp, Plain): comp.text = legacy_split.unmask_zwsp(comp.text)
+                    new = [seg.materialize() for seg in plugin.split_chain_smart(chain, cfg)]
+                    if _shape(old, Plain) != _shape(new, Plain): mismatches.append((pattern, smart, chain, _shape(old, Plain), _shape(new, Plain)))
+
+    for case in mismatches[:3]:
+        print("不一致:", *(repr(x) for x in case), sep="\n  ")
+    print("消息链 {} 条，不一致 {} 处".format(total, len(mismatches)))
+    if mismatches: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
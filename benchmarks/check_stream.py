@@ -0,0 +1,143 @@
+"""
+流式分段顺序检查：模拟框架的流式输出（文本增量与图片等非文本片段交替），
+把插件主动发送的分段与交还框架发送的片段按实际发送顺序记录，检查是否与原始顺序一致。
+
+    python -m benchmarks.check_stream
+
+按 AstrBot 流水线的顺序驱动插件：LLM 请求钩子 → 流式结果（结果装饰阶段对流式结果与空消息链不调用钩子）
+→ 发送阶段调用 event.send_streaming → 流结束后回填的完整结果（STREAMING_FINISH，仍经过装饰钩子，但框架不再发送）。
+分别在后台发送开启/关闭时运行，并确认关闭流式分段时插件不改动流、也不重复发送完整结果。
+另将没有分隔符的长段落、未闭合的代码块按 4 字一段送入分段器，长度增至 4 倍时耗时应约为 4 倍（超过 8 倍视为随长度超线性增长）。
+任一项不通过即以退出码 1 结束。
+"""
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from ._stubs import FakeContext, FakeEvent, FakeResult, MessageChain, ResultContentType, load_plugin
+
+CONFIG = {
+    "split_scope": "all", "split_regex": "[。？！?!\n…]+", "stream_split": True,
+    "delay_strategy": "fixed", "fixed_delay": 0, "enable_tts_for_segments": False, "enable_reply": False,
+}
+
+
+def _cases(c):
+    """(上游片段列表, 预期按顺序发出的内容)，图片记为 [Image]。"""
+    return [
+        ([[c.Plain("前面的文字没有句号")], [c.Image(file="a")], [c.Plain("后面。结尾")]],
+         ["前面的文字没有句号", "[Image]", "后面。", "结尾"]),
+        ([[c.Plain("第一句。第")], [c.Plain("二句")], [c.Image(file="a")], [c.Image(file="b")], [c.Plain("（括号没闭合")], [c.Image(file="c")], [c.Plain("新的一句。")]],
+         ["第一句。", "第二句", "[Image]", "[Image]", "（括号没闭合", "[Image]", "新的一句。"]),
+        ([[c.Image(file="a")], [c.Plain("只有")], [c.Plain("文字。")]],
+         ["[Image]", "只有文字。"]),
+    ]
+
+
+SCALING_SIZE = 20000
+SCALING_TEXTS = {
+    "无分隔符长段落": lambda n: ("这是一段没有任何句号的很长的文字" * n)[:n],
+    "未闭合代码块": lambda n: "开头。```python\n" + ("x = 1 + 2  # 注释\n" * n)[:n],
+}
+
+
+def _render(chain) -> str:
+    return "".join(comp.text if hasattr(comp, "text") else "[{}]".format(type(comp).__name__) for comp in chain)
+
+
+class StreamEvent(FakeEvent):
+    """send_streaming 按平台适配器的方式逐个消费流中的片段并记录。"""
+
+    def __init__(self, log: list):
+        super().__init__()
+        self.log = log
+
+    async def send_streaming(self, generator, use_fallback: bool = False):
+        async for chain in generator:
+            self.log.append(_render(chain.chain))
+
+
+async def _decorate_and_respond(plugin, event) -> None:
+    """结果装饰阶段与发送阶段的判断（astrbot ResultDecorateStage / RespondStage）。"""
+    result = event.get_result()
+    if result.chain and result.result_content_type != ResultContentType.STREAMING_RESULT:
+        await plugin.on_decorating_result(event)
+    if result.result_content_type == ResultContentType.STREAMING_FINISH: return
+    if result.result_content_type == ResultContentType.STREAMING_RESULT:
+        await event.send_streaming(result.async_stream, False)
+    elif result.chain:
+        event.log.append(_render(result.chain))
+
+
+async def _run(plugin_mod, chunks, async_delivery: bool, stream_split: bool = True):
+    log = []
+    ctx = FakeContext(record=False)
+    ctx.on_sent = lambda umo, chain: log.append(_render(chain))
+    plugin = plugin_mod.MessageSplitterPlugin(ctx, dict(CONFIG, async_delivery=async_delivery, stream_split=stream_split))
+
+    async def upstream():
+        for comps in chunks:
+            yield MessageChain(list(comps))
+
+    event = StreamEvent(log)
+    await plugin.on_llm_request(event, SimpleNamespace(system_prompt=""))
+    event.set_result(FakeResult([], content_type=ResultContentType.STREAMING_RESULT, async_stream=upstream()))
+    await _decorate_and_respond(plugin, event)
+    # 流结束后框架回填完整回复
+    full = [comp for comps in chunks for comp in comps]
+    event.set_result(FakeResult(full, content_type=ResultContentType.STREAMING_FINISH))
+    await _decorate_and_respond(plugin, event)
+    await plugin.terminate()
+    return log
+
+
+def _feed_time(plugin_mod, text: str, conf: dict, step: int = 4) -> float:
+    cfg = plugin_mod.SplitterSettings.build(lambda key, default: conf.get(key, default), plugin_mod.PatternRegistry())
+    best = float("inf")
+    for _ in range(2):
+        splitter = plugin_mod.StreamingSplitter(cfg)
+        start = time.perf_counter()
+        for i in range(0, len(text), step): splitter.feed(text[i:i + step])
+        splitter.finish()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _check_scaling(plugin_mod) -> int:
+    failed = 0
+    for label, conf in (("", {}), ("（前置清理）", {"clean_before_regex": "<think>.*?</think>"})):
+        for name, make in SCALING_TEXTS.items():
+            small = _feed_time(plugin_mod, make(SCALING_SIZE), conf)
+            large = _feed_time(plugin_mod, make(SCALING_SIZE * 4), conf)
+            print("{}{}：{} 字 {:.1f} ms，{} 字 {:.1f} ms".format(name, label, SCALING_SIZE, small * 1e3, SCALING_SIZE * 4, large * 1e3))
+            if large > small * 8:
+                failed += 1
+                print("  耗时随长度超线性增长")
+    return failed
+
+
+def main():
+    plugin_mod = load_plugin()
+    components = __import__("astrbot.api.message_components", fromlist=["Plain"])
+    failed = 0
+    for async_delivery in (True, False):
+        for chunks, expected in _cases(components):
+            got = asyncio.run(_run(plugin_mod, chunks, async_delivery))
+            if got != expected:
+                failed += 1
+                print("不一致（后台发送 {}）:\n  预期 {}\n  实际 {}".format(async_delivery, expected, got))
+    # 关闭流式分段：框架按原样逐个发送上游片段，插件不应再补发完整结果
+    for chunks, _ in _cases(components):
+        got = asyncio.run(_run(plugin_mod, chunks, True, stream_split=False))
+        expected = [_render(comps) for comps in chunks]
+        if got != expected:
+            failed += 1
+            print("不一致（关闭流式分段）:\n  预期 {}\n  实际 {}".format(expected, got))
+    print("流式用例 {} 个，不一致 {} 个".format(len(_cases(components)) * 3, failed))
+    failed += _check_scaling(plugin_mod)
+    if failed: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
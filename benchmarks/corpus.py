@@ -0,0 +1,94 @@
+"""
+分段性能测试用语料：按固定随机种子生成，保证每次运行内容一致。
+
+每类语料是若干条“回复”，每条回复是一个消息组件列表。
+"""
+import random
+from typing import Callable, Dict, List
+
+ZH_SENTENCES = [
+    "今天天气不错，适合出去走走。", "你说得对！", "这个问题其实挺复杂的，我们一步一步来看？",
+    "（小声）其实我也不太确定……", "《三体》里有一句话叫“给岁月以文明”。", "好的；那就这么定了。",
+    "嗯嗯", "哈哈哈哈哈！", "我觉得可以试试【方案二】，成本更低。", "稍等一下，我查一下资料。",
+]
+EN_SENTENCES = [
+    "Sure, here's what I found.", "The value of pi is about 3.14, e.g. for quick estimates.",
+    "Mr. Smith said: \"it's fine!\"", "Let me think about it...", "Yes!", "See https://example.com/a.b?c=d for details.",
+    "Step 1: install the package; step 2: run it.", "(Just kidding.)",
+]
+CODE_BLOCKS = [
+    "```python\ndef add(a, b):\n    return a + b\n```",
+    "```bash\npip install -r requirements.txt\npython main.py\n```",
+    "```json\n{\"key\": \"value\", \"list\": [1, 2, 3]}\n```",
+]
+KAOMOJI = ["```(QAQ)```", "```(^_^)```", "```(╯°□°）╯︵ ┻━┻```"]
+
+
+def _sentences(rnd: random.Random, pool: List[str], chars: int) -> str:
+    out, size = [], 0
+    while size < chars:
+        s = rnd.choice(pool)
+        out.append(s)
+        size += len(s)
+        if rnd.random() < 0.15:
+            out.append("\n")
+    return "".join(out)
+
+
+def short_chat(rnd: random.Random, c) -> List:
+    text = _sentences(rnd, ZH_SENTENCES, rnd.randint(20, 120))
+    if rnd.random() < 0.3:
+        text += rnd.choice(KAOMOJI)
+    chain = [c.Plain(text)]
+    if rnd.random() < 0.2:
+        chain.insert(0, c.At(qq="10001"))
+    if rnd.random() < 0.1:
+        chain.append(c.Image(file="https://example.com/a.png"))
+    return chain
+
+
+def long_answer(rnd: random.Random, c) -> List:
+    return [c.Plain(_sentences(rnd, ZH_SENTENCES + EN_SENTENCES, 20000))]
+
+
+def code_heavy(rnd: random.Random, c) -> List:
+    parts = []
+    for _ in range(rnd.randint(6, 14)):
+        parts.append(_sentences(rnd, ZH_SENTENCES + EN_SENTENCES, 80))
+        parts.append("\n" + rnd.choice(CODE_BLOCKS) + "\n")
+    return [c.Plain("".join(parts))]
+
+
+def think_heavy(rnd: random.Random, c) -> List:
+    think = _sentences(rnd, ZH_SENTENCES + EN_SENTENCES, rnd.randint(800, 3000))
+    answer = _sentences(rnd, ZH_SENTENCES, rnd.randint(100, 600))
+    return [c.Plain("<think>" + think + "</think>\n" + answer)]
+
+
+def mixed_zh_en(rnd: random.Random, c) -> List:
+    text = _sentences(rnd, ZH_SENTENCES + EN_SENTENCES * 2, rnd.randint(300, 2000))
+    chain = [c.Plain(text[: len(text) // 2]), c.Image(file="a.png"), c.Plain(text[len(text) // 2:])]
+    if rnd.random() < 0.3:
+        chain.insert(0, c.Reply(id="42"))
+    return chain
+
+
+CATEGORIES: Dict[str, Callable] = {
+    "short_chat": short_chat,
+    "long_20k": long_answer,
+    "code_fence": code_heavy,
+    "think_heavy": think_heavy,
+    "mixed_zh_en": mixed_zh_en,
+}
+# 每类语料默认生成的回复条数（长文本条数较少以控制总耗时）
+DEFAULT_COUNTS = {"short_chat": 400, "long_20k": 10, "code_fence": 60, "think_heavy": 60, "mixed_zh_en": 120}
+
+
+def build_corpus(components, seed: int = 20260417, scale: float = 1.0) -> Dict[str, List[List]]:
+    """components 需提供 Plain/Image/At/Reply 类（模块或命名空间均可）。"""
+    rnd = random.Random(seed)
+    corpus = {}
+    for name, factory in CATEGORIES.items():
+        count = max(1, int(DEFAULT_COUNTS[name] * scale))
+        corpus[name] = [factory(rnd, components) for _ in range(count)]
+    return corpus
@@ -0,0 +1,108 @@
+"""
+1.3.x 版本的分段实现（逐字符扫描），原样保留作为对照，供 check_parity 验证新扫描器输出不变。
+只保留非均分路径（ideal=0）；均分模式已改为最优划分，结果按设计不同，不做对照。
+零宽空格沿用当时的占位符替换与还原。
+"""
+import re
+
+PAIR_MAP = {
+    '“': '”', "《": "》", "（": "）", "(": ")",
+    "[": "]", "{": "}", "‘": "’", "【": "】", "<": ">",
+}
+QUOTE_CHARS = {'"', "'", "`"}
+
+
+def process_text_simple(text, pattern, segments, buffer, plain):
+    parts = re.split("({})".format(pattern), text)
+    tmp = ""
+    for p in parts:
+        if not p: continue
+        if re.fullmatch(pattern, p):
+            tmp += p; buffer.append(plain(tmp))
+            segments.append(buffer[:]); buffer.clear(); tmp = ""
+        else: tmp += p
+    if tmp: buffer.append(plain(tmp))
+
+
+def process_text_smart(text, pattern, segments, buffer, plain):
+    stack = []; compiled = re.compile(pattern); i = 0; n = len(text); chunk = ""
+
+    while i < n:
+        if text.startswith("```", i):
+            idx = text.find("```", i + 3)
+            if idx != -1: chunk += text[i:idx+3]; i = idx+3; continue
+            else: chunk += text[i:]; break
+        if text.startswith("<think>", i):
+            idx = text.find("</think>", i + 7)
+            if idx != -1: chunk += text[i:idx+8]; i = idx+8; continue
+            else: chunk += text[i:]; break
+
+        match = compiled.match(text, pos=i)
+        if match:
+            delim = match.group(); should = False
+            if not stack or "\n" in delim:
+                should = True
+                if "\n" not in delim and re.match(r"^[ \t.?!,;:\-']+$", delim):
+                    p_c = text[i-1] if i > 0 else ""; n_c = text[i+len(delim)] if i+len(delim) < n else ""
+                    if re.match(r"^[a-zA-Z0-9 \t.?!,;:\-']$", p_c) and re.match(r"^[a-zA-Z0-9 \t.?!,;:\-']$", n_c): should = False
+            if should:
+                chunk += delim; buffer.append(plain(chunk))
+                segments.append(buffer[:]); buffer.clear(); chunk = ""; i += len(delim)
+            else: chunk += delim; i += len(delim)
+            continue
+
+        char = text[i]
+        if char in QUOTE_CHARS:
+            if stack and stack[-1] == char: stack.pop()
+            else: stack.append(char)
+        elif not stack and char in PAIR_MAP: stack.append(char)
+        elif stack and char == PAIR_MAP.get(stack[-1]): stack.pop()
+
+        chunk += char; i += 1
+    if chunk: buffer.append(plain(chunk))
+
+
+def mask_zwsp(text):
+    return text.replace("\u200b \u200b", "__ZWSP_DOUBLE__").replace("\u200b", "__ZWSP_SINGLE__")
+
+
+def unmask_zwsp(text):
+    return text.replace("__ZWSP_DOUBLE__", "\u200b \u200b").replace("__ZWSP_SINGLE__", "\u200b")
+
+
+def split_text(text, pattern, smart):
+    """单段文本的切分结果（字符串列表），零宽空格按旧版方式替换后切分再还原。"""
+    segments, buffer = [], []
+    process = process_text_smart if smart else process_text_simple
+    process(mask_zwsp(text), pattern, segments, buffer, lambda s: s)
+    pieces = [s for seg in segments for s in seg] + buffer
+    return [unmask_zwsp(s) for s in pieces]
+
+
+def split_chain(chain, pattern, smart, strategies, keep_reply, plain):
+    """旧版 split_chain_smart（ideal=0），返回组件列表的列表；文本需已做零宽空格替换。"""
+    segments = []; buffer = []
+    for comp in chain:
+        if isinstance(comp, plain):
+            if not comp.text: continue
+            if not smart: process_text_simple(comp.text, pattern, segments, buffer, plain)
+            else: process_text_smart(comp.text, pattern, segments, buffer, plain)
+        else:
+            c_type = type(comp).__name__.lower()
+            if "reply" in c_type:
+                if keep_reply: buffer.append(comp)
+                continue
+            strategy = strategies.get(c_type, strategies.get("default", "跟随下段"))
+            if strategy == "单独":
+                if buffer: segments.append(buffer[:]); buffer.clear()
+                segments.append([comp])
+            elif strategy == "跟随上段":
+                if buffer: buffer.append(comp); segments.append(buffer[:]); buffer.clear()
+                elif segments: segments[-1].append(comp)
+                else: segments.append([comp])
+            elif strategy in ["跟随下段", "接下文"]:
+                if buffer: segments.append(buffer[:]); buffer.clear()
+                buffer.append(comp)
+            else: buffer.append(comp)
+    if buffer: segments.append(buffer)
+    return [s for s in segments if s]
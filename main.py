@@ -1,10 +1,24 @@
 # main.py
+import os
 import re
+import json
+import bisect
+import logging
 import math
+import time
 import random
 import asyncio
-from collections import defaultdict, deque
-from typing import List, Dict, Any
+import functools
+from types import MappingProxyType
+from dataclasses import dataclass, field
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Any, Awaitable, Callable, Mapping, Optional, Pattern, FrozenSet, Tuple
+
+try:
+    import re._parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
 
 from astrbot.api.event import filter, AstrMessageEvent, MessageChain
 from astrbot.api.star import Context, Star
@@ -13,6 +27,1585 @@ from astrbot.api.provider import LLMResponse, ProviderRequest
 from astrbot.api.message_components import Plain, BaseMessageComponent, Reply, Record
 from astrbot.core.star.session_llm_manager import SessionServiceManager
 
+# 嵌套配置分类（与 _conf_schema.json 顶层分组一致）
+CONFIG_CATEGORIES = (
+    "basic_settings", "split_settings", "clean_settings",
+    "reply_media_settings", "delay_settings", "profile_settings", "advanced_settings",
+)
+# 配置方案可覆盖的配置项：只影响单条回复处理方式的项；并发、限速、缓存等插件级资源仍按全局配置
+PROFILE_KEYS = frozenset((
+    "enable_group_split", "split_scope", "max_length_no_split", "max_length_to_disable",
+    "split_mode", "split_chars", "split_regex", "enable_smart_split", "protect_tags", "stream_split", "balanced_split_mode",
+    "max_segments", "min_segment_length", "balanced_split_ratio_min", "balanced_split_ratio_max", "trim_segment_edge_blank_lines",
+    "clean_before_items", "clean_after_items", "clean_before_regex", "clean_after_regex", "inject_kaomoji_prompt",
+    "enable_smart_reply", "enable_reply", "image_strategy", "at_strategy", "face_strategy", "other_media_strategy",
+    "delay_strategy", "linear_base", "linear_factor", "log_base", "log_factor", "random_min", "random_max", "fixed_delay",
+    "async_delivery", "new_reply_policy", "enable_tts_for_segments",
+))
+DEFAULT_SPLIT_CHARS = ["。", "？", "！", "?", "!", "；", ";", "\n"]
+DEFAULT_SPLIT_REGEX = "[。？！?!\n…]+"
+
+
+def _to_int(value: Any, default: int) -> int:
+    try: return int(value)
+    except (TypeError, ValueError): return default
+
+
+def _to_float(value: Any, default: float) -> float:
+    try: return float(value)
+    except (TypeError, ValueError): return default
+
+
+def _to_str_tuple(value: Any) -> Tuple[str, ...]:
+    if value is None: return ()
+    if isinstance(value, str): return (value,) if value else ()
+    return tuple(str(i) for i in value if i is not None and str(i))
+
+
+# 英文语境判断：分隔符两侧均为英文/数字字符时不切分（如 "e.g." "3.14"）
+_EN_DELIM_RE = re.compile(r"[ \t.?!,;:\-']+")
+_EN_CONTEXT_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 \t.?!,;:-'")
+_WS_RE = re.compile(r"\s+")
+# 全部 Unicode 空白字符（与 \s / str.isspace 一致，最大码位为 U+3000）
+_WS_CHARS = tuple(chr(i) for i in range(0x3001) if chr(i).isspace())
+# 开头空行：配合 match(text, pos, endpos) 直接作用于文本区间；结尾空行见 _trailing_blank_start
+_LEADING_BLANK_LINES_RE = re.compile(r'(?:[ \t]*\r?\n)+')
+# 判断空段时视为空白的字符之外的任意字符
+_VISIBLE_CHAR_RE = re.compile("[^ \t\r\n\u200b]")
+
+
+def _trailing_blank_start(text: str, start: int, end: int) -> int:
+    """
+    text[start:end] 末尾空行（换行符及其后的空格、制表符）的起点，没有时返回 end。
+    从末尾向前只检查空白字符，超长段落也不必像正则 search 那样从段首逐位置尝试。
+    """
+    cut = i = end
+    while True:
+        while i > start and text[i - 1] in " \t": i -= 1
+        if i == start or text[i - 1] != "\n": return cut
+        i -= 1
+        if i > start and text[i - 1] == "\r": i -= 1
+        cut = i
+
+
+def _nonspace_len(text: str) -> int:
+    """非空白字符数，与逐字符 `not ch.isspace()` 计数一致。"""
+    return len(_WS_RE.sub("", text)) if text else 0
+
+
+def _nonspace_prefix(text: str, offsets: List[int]) -> List[int]:
+    """各下标（非递减）之前的非空白字符数，等价于逐个调用 _nonspace_len(text[:o])，只对文本中出现的空白字符分段计数。"""
+    spaces = [c for c in _WS_CHARS if c in text]
+    if not spaces: return list(offsets)
+    out = []; prev = 0; weight = 0
+    for o in offsets:
+        weight += o - prev
+        for c in spaces: weight -= text.count(c, prev, o)
+        out.append(weight); prev = o
+    return out
+
+
+def _delimiter_lookahead(pattern: Pattern, cap: int = 32) -> int:
+    """
+    估算确认一次分隔符匹配已结束所需的后续字符数。
+    形如 `X+` 的分隔符只需看到一个完整的 X 宽度；其余情况按最大宽度（封顶 cap）估计。
+    """
+    try:
+        items = list(_sre_parse.parse(pattern.pattern, pattern.flags))
+        if len(items) == 1 and items[0][0] in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT):
+            return max(1, min(items[0][1][2].getwidth()[1], cap))
+    except Exception:
+        return cap
+    return _match_width(pattern, cap)
+
+
+def _match_width(pattern: Pattern, cap: int = 32) -> int:
+    """正则单次匹配的最大宽度（至少为 1，封顶 cap），无法解析时返回 cap。"""
+    try:
+        width = _sre_parse.parse(pattern.pattern, pattern.flags).getwidth()[1]
+    except Exception:
+        return cap
+    return max(1, min(width, cap))
+
+
+def _build_simple_pattern(chars) -> str:
+    """将简单分隔符列表转为非捕获的交替正则，长串优先匹配。"""
+    processed = []
+    for c in chars:
+        if not c: continue
+        processed.append(re.escape(str(c).replace("\\n", "\n").replace("\\t", "\t")))
+    processed.sort(key=len, reverse=True)
+    return "(?:{})+".format("|".join(processed)) if processed else r"[\n]+"
+
+
+# 外部 At 插件以零宽空格包裹文本，这些片段整体视为受保护区间，不在其内部切分（无结束标记）
+_ZWSP_TAGS = (("\u200b \u200b", None), ("\u200b", None))
+# 智能分段内置的保护标记：代码块（颜文字提示词要求的 ```(QAQ)``` 同样由此保护）与思维链
+_BUILTIN_PROTECT_TAGS = (("```", "```"), ("<think>", "</think>"))
+
+
+def _parse_protect_tags(items: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+    """
+    解析自定义保护标记：“开始标记|结束标记”；形如 <tag> 或 <tag 属性> 的单个标签自动以 </tag> 结束；
+    其余单个标记首尾相同（如 $$）。
+    """
+    pairs = []
+    for item in items:
+        opener, sep, closer = item.partition("|")
+        opener = opener.strip(); closer = closer.strip()
+        if not opener or (sep and not closer):
+            logger.warning("[Splitter] 保护标记格式无效，已忽略: {}".format(item)); continue
+        if not sep:
+            tag = re.fullmatch(r"<([A-Za-z][\w:.-]*)(?:\s[^<>]*)?(?<!/)>", opener)
+            closer = "</{}>".format(tag.group(1)) if tag else opener
+        pairs.append((opener, closer))
+    return tuple(pairs)
+
+
+class ProtectedTags:
+    """
+    受保护区间的标记表：全部开始标记合并为一个预编译正则，切分前对每段文本预扫描一次，
+    得到按位置排序、互不重叠的区间列表，切分时整体跳过；增加标记不增加逐字符的开销。
+    结束标记为 None 的标记自身即完整区间；未闭合的开始标记一律保护到文本末尾。
+    只含字符串与预编译正则，可随切分任务交给进程池。
+    """
+
+    def __init__(self, pairs):
+        self.closers: Dict[str, Optional[str]] = {}
+        for opener, closer in pairs:
+            if opener and opener not in self.closers: self.closers[opener] = closer
+        # 长标记优先，避免被其前缀抢先匹配
+        self.opener_re = re.compile("|".join(re.escape(o) for o in sorted(self.closers, key=len, reverse=True)))
+
+    def spans(self, text: str, pos: int = 0, endpos: Optional[int] = None) -> List[Tuple[int, int]]:
+        """文本 pos 之后的受保护区间 [(起点, 终点)]，按起点排序；给出 endpos 时只收集起点在其之前的区间。"""
+        spans = []; n = len(text)
+        search = self.opener_re.search; closers = self.closers
+        while True:
+            m = search(text, pos)
+            if m is None or (endpos is not None and m.start() >= endpos): return spans
+            closer = closers[m.group()]
+            if closer is None: pos = m.end()
+            else:
+                idx = text.find(closer, m.end())
+                pos = idx + len(closer) if idx != -1 else n
+            spans.append((m.start(), pos))
+
+    def unclosed_start(self, text: str) -> Optional[int]:
+        """返回未闭合（或开始标记尚未收全）的受保护区间起点，全部闭合时返回 None。"""
+        pos = 0; n = len(text)
+        while True:
+            m = self.opener_re.search(text, pos)
+            if m is None: break
+            closer = self.closers[m.group()]
+            if closer is None: pos = m.end(); continue
+            idx = text.find(closer, m.end())
+            if idx == -1: return m.start()
+            pos = idx + len(closer)
+        partial = [size for opener, closer in self.closers.items() if closer is not None
+                   for size in range(len(opener) - 1, 0, -1) if text.endswith(opener[:size]) and n - size >= pos]
+        return n - max(partial) if partial else None
+
+
+_ZWSP_PROTECTED = ProtectedTags(_ZWSP_TAGS)
+_DEFAULT_PROTECTED = ProtectedTags(_ZWSP_TAGS + _BUILTIN_PROTECT_TAGS)
+
+
+def _delimiter_cuts(pattern: Pattern, text: str) -> List[int]:
+    """非智能模式的切分点：各非空分隔符匹配的结束下标，跳过零宽空格片段。"""
+    if "\u200b" not in text:
+        return [m.end() for m in pattern.finditer(text) if m.end() > m.start()]
+    return _delimiter_scan(pattern, text)[0]
+
+
+def _delimiter_scan(pattern: Pattern, text: str, start: int = 0, stop: Optional[int] = None) -> Tuple[List[int], int]:
+    """
+    从 start 起求非智能模式的切分点，返回 (切分点, 续扫位置)。
+    给出 stop 时只处理在 stop 之前结束的分隔符，遇到第一个越过 stop 的匹配即停止，
+    之后从续扫位置重新扫描（流式分段每次只扫描新收到的文本）。
+    """
+    n = len(text); limit = n if stop is None else stop
+    spans = _ZWSP_PROTECTED.spans(text, start, limit) if text.find("\u200b", start) != -1 else []
+    cuts = []; pos = start
+    for gap_end, span_end in spans + [(n, None)]:
+        for m in pattern.finditer(text, pos, gap_end):
+            if m.end() > limit: return cuts, max(pos, min(m.start(), limit))
+            if m.end() > m.start(): cuts.append(m.end())
+        if span_end is None: return cuts, max(pos, limit)
+        pos = span_end
+
+
+# 成对出现的字符，智能分段时避免在这些符号内部切断
+_PAIR_MAP = MappingProxyType({
+    '“': '”', "《": "》", "（": "）", "(": ")",
+    "[": "]", "{": "}", "‘": "’", "【": "】", "<": ">",
+})
+# 引用/引号字符
+_QUOTE_CHARS = frozenset({'"', "'", "`"})
+# 均分模式可用的次级标点
+_SECONDARY_RE = re.compile(r"[，,、；;]+")
+# 智能分段的事件符号：所有引号、成对符号（受保护区间由 ProtectedTags 预先求出）
+_SMART_EVENT_RE = re.compile("[{}]".format(
+    "".join(re.escape(c) for c in sorted(_QUOTE_CHARS | set(_PAIR_MAP) | set(_PAIR_MAP.values())))))
+
+
+def _scan_smart_cuts(text: str, pattern: Pattern, stack: Optional[list] = None, soft: Optional[List[int]] = None, protected: ProtectedTags = _DEFAULT_PROTECTED) -> List[int]:
+    """
+    智能分段扫描：返回切分点（各段结束下标）。
+    先由 protected 求出受保护区间（代码块、思维链、自定义标记与零宽空格片段），扫描时整体跳过；
+    其余只在“事件”位置（分隔符、成对/引号符号）做判断，事件之间的普通文本整体跳过，
+    复杂度与文本长度呈线性关系。分隔符不会延伸进受保护区间。
+    传入 stack 时以其作为初始成对符号栈，并原地更新为扫描结束时的状态；
+    传入 soft 时，成对符号之外的次级标点切分点会追加到其中（供均分模式挑选）。
+    """
+    return _smart_scan(text, pattern, stack, soft, protected)[0]
+
+
+def _smart_scan(text: str, pattern: Pattern, stack: Optional[list] = None, soft: Optional[List[int]] = None, protected: ProtectedTags = _DEFAULT_PROTECTED,
+                start: int = 0, stop: Optional[int] = None) -> Tuple[List[int], int]:
+    """
+    _scan_smart_cuts 的扫描主体：从 start 起扫描，返回 (切分点, 续扫位置)。
+    给出 stop 时只处理 stop 之前的事件，且越过 stop 的分隔符、未闭合的受保护区间都在其起点处停止，
+    stack 为停止处的状态；之后从续扫位置携带 stack 继续扫描，结果与一次扫描全文相同。
+    """
+    cuts = []; i = start; n = len(text)
+    if stack is None: stack = []
+    quote_chars = _QUOTE_CHARS; pair_map = _PAIR_MAP
+    event_re = _SMART_EVENT_RE; secondary = _SECONDARY_RE
+    delim_m = None; event_m = None
+    spans = protected.spans(text, start, stop); k = 0
+
+    while i < n:
+        # 下一个主分隔符（跳过空匹配）与下一个事件符号，仅在已被越过时重新查找
+        if delim_m is not None and delim_m.start() < i: delim_m = None
+        if delim_m is None:
+            delim_m = pattern.search(text, i)
+            while delim_m is not None and delim_m.end() == delim_m.start():
+                delim_m = pattern.search(text, delim_m.start() + 1) if delim_m.start() < n else None
+        if event_m is not None and event_m.start() < i: event_m = None
+        if event_m is None: event_m = event_re.search(text, i)
+        while k < len(spans) and spans[k][0] < i: k += 1
+        d_pos = delim_m.start() if delim_m is not None else n
+        e_pos = event_m.start() if event_m is not None else n
+        s_pos = spans[k][0] if k < len(spans) else n
+        if d_pos < s_pos < delim_m.end():
+            # 分隔符不能延伸进受保护区间，截止到区间起点重新匹配
+            delim_m = pattern.search(text, d_pos, s_pos)
+            while delim_m is not None and delim_m.end() == delim_m.start():
+                delim_m = pattern.search(text, delim_m.start() + 1, s_pos) if delim_m.start() < s_pos else None
+            d_pos = delim_m.start() if delim_m is not None else n
+        p = min(d_pos, e_pos, s_pos)
+
+        # 普通文本区间 [i, p)：记录次级标点切分点
+        if soft is not None and not stack and i < p:
+            soft.extend(m.end() for m in secondary.finditer(text, i, p))
+        if stop is not None and p >= stop:
+            # 停止位置之后的文本可能还有未收全的受保护标记，从 stop 处（或已越过的位置）续扫
+            i = max(i, stop); break
+        i = p
+        if i >= n: break
+
+        if s_pos == p:
+            # 受保护区间整体跳过，不在其内部或起点上切分；分段扫描时未闭合的区间留待闭合后再扫描
+            if stop is not None and spans[k][1] >= n: break
+            i = spans[k][1]; k += 1
+            continue
+
+        if d_pos == p:
+            if stop is not None and delim_m.end() > stop: break
+            delim = delim_m.group(); end = delim_m.end(); should = False
+            if not stack or "\n" in delim:
+                should = True
+                if "\n" not in delim and _EN_DELIM_RE.fullmatch(delim):
+                    p_c = text[i-1] if i > 0 else ""; n_c = text[end] if end < n else ""
+                    if p_c in _EN_CONTEXT_CHARS and n_c in _EN_CONTEXT_CHARS: should = False
+            if should: cuts.append(end)
+            i = end
+            continue
+
+        # 事件为成对/引号符号
+        char = event_m.group()
+        if char in quote_chars:
+            if stack and stack[-1] == char: stack.pop()
+            else: stack.append(char)
+        elif not stack and char in pair_map: stack.append(char)
+        elif stack and char == pair_map.get(stack[-1]): stack.pop()
+        i += 1
+    return cuts, i
+
+
+def _prepare_texts(texts: List[str], clean_re: Optional[Pattern], pattern: Pattern, smart: bool, with_soft: bool, protected: ProtectedTags = _DEFAULT_PROTECTED) -> List[Tuple[str, List[int], Optional[List[int]]]]:
+    """
+    纯文本切分核心：对每段文本执行前置清理并求出切分点，with_soft 时一并给出次级标点切分点。
+    只接收字符串与预编译正则、返回基本类型，可直接交给线程池或进程池执行。
+    """
+    out = []
+    for text in texts:
+        if clean_re is not None: text = clean_re.sub("", text)
+        soft: Optional[List[int]] = [] if smart and with_soft else None
+        hard = _scan_smart_cuts(text, pattern, soft=soft, protected=protected) if smart else _delimiter_cuts(pattern, text)
+        out.append((text, hard, soft))
+    return out
+
+
+def _literal_alternation(items: Tuple[str, ...]) -> str:
+    """将简单清理项合并为一个交替正则，长串优先，一次扫描删除全部条目。"""
+    literals = sorted(set(items), key=len, reverse=True)
+    return "|".join(re.escape(i) for i in literals)
+
+
+def _greedy_partition_cost(weights: List[float], soft: List[bool], total: float, ideal: float, min_weight: float, parts: int, penalty: float) -> float:
+    """在各整分点就近切成 parts 段得到的可行解代价（不可行为 inf），用作最优划分的上界。"""
+    if parts <= 1: return (total - ideal) ** 2
+    bounds = [0.0]; cost = 0.0; last = -1
+    for k in range(1, parts):
+        target = total * k / parts
+        j = bisect.bisect_left(weights, target)
+        if j > 0 and (j == len(weights) or target - weights[j - 1] <= weights[j] - target): j -= 1
+        if j <= last or j >= len(weights): return float("inf")
+        last = j; bounds.append(weights[j])
+        if soft[j]: cost += penalty
+    bounds.append(total)
+    lengths = [bounds[k + 1] - bounds[k] for k in range(parts)]
+    if min(lengths) < min_weight: return float("inf")
+    return cost + sum((w - ideal) ** 2 for w in lengths)
+
+
+def _allocate_parts(costs: List[List[float]], max_parts: int) -> Tuple[float, List[int]]:
+    """costs[b][m-1] 为第 b 块切成 m 段的代价；在总段数不超过 max_parts 时选出总代价最小的各块段数。"""
+    best: Dict[int, Tuple[float, List[int]]] = {0: (0.0, [])}
+    for block in costs:
+        nxt: Dict[int, Tuple[float, List[int]]] = {}
+        for used, (cost, counts) in best.items():
+            for m, c in enumerate(block, 1):
+                if c == float("inf") or used + m > max_parts: continue
+                if used + m not in nxt or cost + c < nxt[used + m][0]:
+                    nxt[used + m] = (cost + c, counts + [m])
+        best = nxt
+    return min(best.values(), key=lambda item: item[0])
+
+
+def _balanced_partition(weights: List[float], soft: List[bool], total: float, ideal: float, min_weight: float, max_parts: int, penalty: float, bound: float = float("inf")) -> List[Tuple[float, List[int]]]:
+    """
+    均分模式的最优划分：在候选切分点中为每个段数 m（1..max_parts）选出使
+    Σ(段权重 - ideal)² 最小的切法，且除整块不切外每段权重不低于 min_weight。
+    weights 为各候选点之前的累计权重（非递减），soft 标记次级标点切分点（每次使用另加 penalty）。
+    返回 result[m-1] = (代价, 选中的候选下标)，不可行时代价为 inf。
+
+    分层 DP：dp_m[i] = min_p dp_{m-1}[p] + (w_i - w_p - ideal)²，展开后是关于 w_i 的一组直线取最小，
+    斜率与查询点均单调，用单调凸包每层线性完成，总复杂度 O(候选数 × 段数)。
+    给出代价上界 bound 时，前 m 段累计偏差满足 |w_i - m·ideal| ≤ √(m·bound)，
+    每层只需计算该窗口内的点；最优代价超过 bound 的段数只保证结果可行，不保证最优。
+    """
+    inf = float("inf")
+    pos = [0.0] + list(weights) + [float(total)]
+    pen = [0.0] + [penalty if f else 0.0 for f in soft] + [0.0]
+    xs = [w - ideal for w in pos]
+    n = len(pos); end = n - 1
+    radius = math.sqrt(bound) * 1.000001 if bound < inf else inf
+    # 当前层窗口 [first, stop)：窗口外的值不可能出现在最优解中
+    first = max(1, bisect.bisect_left(pos, max(min_weight, ideal - radius))); stop = bisect.bisect_right(pos, ideal + radius)
+    # 第 1 层：起点直接切到 i；整块不切总是允许
+    prev = [inf] * n
+    for i in range(first, min(stop, end)): prev[i] = xs[i] * xs[i] + pen[i]
+    prev[end] = xs[end] * xs[end]
+    parents = [[0] * n]
+    result = [(prev[end], [])]
+
+    for layer in range(2, max_parts + 1):
+        # 前一层可行的最小下标；之前的点在本层不可能可行，直接跳过
+        while first < n and prev[first] == inf: first += 1
+        if first >= end:
+            result.extend([(inf, [])] * (max_parts - layer + 1)); break
+        r = radius * math.sqrt(layer)
+        lo = max(first + 1, bisect.bisect_left(pos, layer * ideal - r))
+        hi = bisect.bisect_right(pos, layer * ideal + r)
+        cur = [inf] * n; parent = [0] * n
+        slopes: List[float] = []; intercepts: List[float] = []; owners: List[int] = []
+        head = 0; size = 0; p = first
+        # 最后一层只需求出整块末尾
+        if layer < max_parts: targets = range(lo, min(hi, n))
+        else: targets = (end,) if hi > end else ()
+        for i in targets:
+            # 加入满足最小段长的前驱 p（斜率 -2w_p 单调不增）
+            limit = pos[i] - min_weight
+            while p < i and p < stop and pos[p] <= limit:
+                if prev[p] < inf:
+                    a = -2.0 * pos[p]; b = prev[p] + pos[p] * pos[p]
+                    if size > head and slopes[-1] == a:
+                        if intercepts[-1] <= b: p += 1; continue
+                        slopes.pop(); intercepts.pop(); owners.pop(); size -= 1
+                    while size - head >= 2 and (b - intercepts[-2]) * (slopes[-2] - slopes[-1]) <= (intercepts[-1] - intercepts[-2]) * (slopes[-2] - a):
+                        slopes.pop(); intercepts.pop(); owners.pop(); size -= 1
+                    slopes.append(a); intercepts.append(b); owners.append(p); size += 1
+                p += 1
+            if head >= size: continue
+            x = xs[i]
+            while head + 1 < size and slopes[head + 1] * x + intercepts[head + 1] <= slopes[head] * x + intercepts[head]:
+                head += 1
+            cur[i] = slopes[head] * x + intercepts[head] + x * x + pen[i]
+            parent[i] = owners[head]
+        parents.append(parent)
+        prev = cur; first = lo; stop = hi
+        if cur[end] == inf:
+            result.append((inf, []))
+            continue
+        cuts = []; i = end
+        for k in range(len(parents) - 1, 0, -1):
+            i = parents[k][i]; cuts.append(i - 1)
+        result.append((cur[end], cuts[::-1]))
+    return result
+
+
+_REPEAT_OPS = (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT)
+_CATEGORY_SAMPLES = {"CATEGORY_SPACE": " ", "CATEGORY_DIGIT": "1", "CATEGORY_WORD": "a", "CATEGORY_LINEBREAK": "\n"}
+
+
+def _sample_text(items, limit: int = 16) -> str:
+    """构造一段子模式可匹配的示例文本（每个重复取一次），作为回溯探测的重复单元。"""
+    out = []
+    for op, av in items:
+        if op is _sre_parse.LITERAL: out.append(chr(av))
+        elif op is _sre_parse.NOT_LITERAL: out.append("b" if av == ord("a") else "a")
+        elif op is _sre_parse.ANY: out.append("a")
+        elif op is _sre_parse.IN:
+            if av and av[0][0] is _sre_parse.NEGATE:
+                out.append("b" if (_sre_parse.LITERAL, ord("a")) in av else "a"); continue
+            kind, value = av[0] if av else (None, None)
+            if kind is _sre_parse.LITERAL: out.append(chr(value))
+            elif kind is _sre_parse.RANGE: out.append(chr(value[0]))
+            elif kind is _sre_parse.CATEGORY: out.append(_CATEGORY_SAMPLES.get(str(value), "a"))
+            else: out.append("a")
+        elif op in _REPEAT_OPS: out.append(_sample_text(av[2], limit))
+        elif op is _sre_parse.SUBPATTERN: out.append(_sample_text(av[-1], limit))
+        elif op is _sre_parse.BRANCH: out.append(_sample_text(av[1][0], limit))
+        if sum(map(len, out)) >= limit: break
+    return "".join(out)[:limit]
+
+
+def _backtracking_hotspot(items, unit: Optional[str] = None) -> Optional[str]:
+    """
+    静态检查灾难性回溯风险：无上限重复内部再嵌套无上限重复（如 (a+)+），
+    或无上限重复内存在可匹配相同或互为前缀文本的分支（如 (a|a)*、(a|aa)+）。
+    返回用于探测的重复单元文本，无风险时返回 None。unit 为外层无上限重复的单元文本。
+    """
+    for op, av in items:
+        found = None
+        if op in _REPEAT_OPS:
+            if av[1] == _sre_parse.MAXREPEAT:
+                inner = _sample_text(av[2]) or "a"
+                if unit is not None: return inner
+                found = _backtracking_hotspot(av[2], inner)
+            else:
+                found = _backtracking_hotspot(av[2], unit)
+        elif op is _sre_parse.SUBPATTERN:
+            found = _backtracking_hotspot(av[-1], unit)
+        elif op is _sre_parse.BRANCH:
+            if unit is not None:
+                # 排序后只需比较相邻项：若某示例是另一示例的前缀，则必是其后继的前缀
+                samples = sorted(_sample_text(b) for b in av[1])
+                if any(b.startswith(a) for a, b in zip(samples, samples[1:])): return unit
+            for branch in av[1]:
+                found = found or _backtracking_hotspot(branch, unit)
+        elif op in (_sre_parse.ASSERT, _sre_parse.ASSERT_NOT):
+            found = _backtracking_hotspot(av[1], unit)
+        if found is not None: return found
+    return None
+
+
+def _probe_backtracking(compiled: Pattern, unit: str, budget: float = 0.02) -> bool:
+    """
+    以“重复单元 + 失配结尾”逐个单元加长试跑，单次耗时超过 budget（秒）即判定为危险。
+    指数回溯每多一个单元耗时约翻倍，逐个加长使最后一次试跑不超过 budget 的数倍，单个正则通常在 0.1 s 内判定完。
+    """
+    for size in range(8, 33):
+        start = time.perf_counter()
+        compiled.search(unit * size + "\x00")
+        if time.perf_counter() - start > budget: return True
+    return False
+
+
+class PatternRegistry:
+    """
+    插件自有的正则编译表：按 (pattern, flags) 缓存编译结果，不依赖容量有限的 re 模块缓存。
+    编译时校验语法并检查灾难性回溯风险，不可用的正则在加载时报错一次，而非每条消息失败。
+    AstrBot 保存插件配置后会重载插件，编译表随插件实例整体重建，无需单独失效。
+    回溯试跑在加载时同步进行，总耗时以 probe_budget（秒）为上限：用尽后仍被静态检查标记的正则
+    不再试跑，直接按危险处理。
+    """
+
+    def __init__(self, probe_budget: float = 0.5):
+        self._compiled: Dict[Tuple[str, int], Tuple[Optional[Pattern], str]] = {}
+        self.probe_budget = probe_budget
+        # 配置项 -> 不可用原因，供统计命令展示
+        self.errors: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+    def compile(self, pattern: str, flags: int = 0, name: str = "") -> Optional[Pattern]:
+        """返回编译后的正则；为空或不可用时返回 None（不可用时记录错误）。"""
+        if not pattern: return None
+        key = (pattern, flags)
+        entry = self._compiled.get(key)
+        if entry is None: entry = self._compiled[key] = self._check(pattern, flags)
+        compiled, reason = entry
+        if reason:
+            self.errors[name] = reason
+            logger.error("[Splitter] 配置项 {} 的正则不可用（{}），已忽略: {}".format(name, reason, pattern))
+        return compiled
+
+    def _check(self, pattern: str, flags: int) -> Tuple[Optional[Pattern], str]:
+        try:
+            compiled = re.compile(pattern, flags)
+        except re.error as e:
+            return None, "语法错误: {}".format(e)
+        try:
+            unit = _backtracking_hotspot(_sre_parse.parse(pattern, flags))
+        except Exception:
+            unit = None
+        if unit is None: return compiled, ""
+        if self.probe_budget <= 0: return None, "可能发生灾难性回溯，且超出加载时的检查时限，未能试跑确认"
+        start = time.perf_counter()
+        dangerous = _probe_backtracking(compiled, unit)
+        self.probe_budget -= time.perf_counter() - start
+        if dangerous: return None, "可能发生灾难性回溯，匹配耗时随长度指数增长"
+        return compiled, ""
+
+
+@dataclass(frozen=True)
+class SplitterSettings:
+    """
+    配置快照：在迁移完成后由 `_get_cfg` 一次性解析生成，正则经 PatternRegistry 校验编译，
+    列表项归一化。热路径只读取该对象的属性，配置变更时整体重建。
+    """
+    # 基础设置
+    enable_group_split: bool
+    split_scope: str
+    max_length_no_split: int
+    max_length_to_disable: int
+    conversation_blacklist: FrozenSet[str]
+    conversation_whitelist: FrozenSet[str]
+    # 分段规则
+    split_mode: str
+    split_pattern: str
+    split_re: Pattern
+    split_lookahead: int
+    enable_smart_split: bool
+    protect_tags: Tuple[str, ...]
+    protected: ProtectedTags = field(repr=False, compare=False)
+    stream_split: bool
+    balanced_split_mode: bool
+    max_segments: int
+    min_segment_length: int
+    balanced_split_ratio_min: float
+    balanced_split_ratio_max: float
+    trim_segment_edge_blank_lines: bool
+    # 文本清理（clean_*_re 为当前分段模式实际生效的清理正则）
+    clean_before_items: Tuple[str, ...]
+    clean_after_items: Tuple[str, ...]
+    clean_before_re: Optional[Pattern]
+    clean_after_re: Optional[Pattern]
+    clean_before_width: int
+    inject_kaomoji_prompt: bool
+    # 回复与组件
+    enable_smart_reply: bool
+    enable_reply: bool
+    strategies: Mapping[str, str]
+    max_tracked_conversations: int
+    conversation_idle_ttl: float
+    tts_concurrency: int
+    tts_cache_size: int
+    tts_cache_ttl: float
+    # 发送延迟
+    delay_strategy: str
+    linear_base: float
+    linear_factor: float
+    log_base: float
+    log_factor: float
+    random_min: float
+    random_max: float
+    fixed_delay: float
+    async_delivery: bool
+    max_concurrent_deliveries: int
+    new_reply_policy: str
+    send_rate_limit: float
+    send_rate_burst: int
+    platform_rate_limits: Mapping[str, Tuple[float, int]]
+    send_retry_times: int
+    send_retry_backoff: float
+    enable_tts_for_segments: bool
+    # 高级设置
+    enable_metrics: bool
+    metrics_dump_path: str
+    metrics_dump_interval: float
+    offload_threshold: int
+    offload_executor: str
+    split_cache_size: int
+    # 影响前置清理、切分与合并结果的配置指纹（切分缓存键的一部分），由 __post_init__ 生成
+    split_fingerprint: Tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        clean = self.clean_before_re
+        object.__setattr__(self, "split_fingerprint", (
+            self.split_pattern, self.enable_smart_split, self.protect_tags, self.balanced_split_mode, self.max_segments,
+            self.min_segment_length, self.balanced_split_ratio_min, self.balanced_split_ratio_max,
+            tuple(self.strategies.items()), self.enable_reply or self.enable_smart_reply,
+            (clean.pattern, clean.flags) if clean is not None else None,
+        ))
+
+    @classmethod
+    def build(cls, get_cfg: Callable[[str, Any], Any], patterns: PatternRegistry, label: str = "") -> "SplitterSettings":
+        """label 为配置方案名，用于区分各方案的正则错误（全局配置为空）。"""
+        tag = (lambda key: "{}/{}".format(label, key)) if label else (lambda key: key)
+        split_mode = get_cfg("split_mode", "regex")
+        if split_mode == "simple":
+            split_pattern = _build_simple_pattern(get_cfg("split_chars", DEFAULT_SPLIT_CHARS) or [])
+            split_re = patterns.compile(split_pattern, 0, tag("split_chars"))
+        else:
+            split_pattern = get_cfg("split_regex", DEFAULT_SPLIT_REGEX) or DEFAULT_SPLIT_REGEX
+            split_re = patterns.compile(split_pattern, 0, tag("split_regex"))
+        if split_re is None:
+            logger.error("[Splitter] {}分段正则不可用，已回退默认分段正则".format("配置方案 {} 的".format(label) if label else ""))
+            split_pattern = DEFAULT_SPLIT_REGEX
+            split_re = patterns.compile(split_pattern)
+        protect_tags = _to_str_tuple(get_cfg("protect_tags", []))
+        custom_tags = _parse_protect_tags(protect_tags)
+        clean_before_items = _to_str_tuple(get_cfg("clean_before_items", []))
+        clean_after_items = _to_str_tuple(get_cfg("clean_after_items", []))
+        if split_mode == "simple":
+            clean_before_re = patterns.compile(_literal_alternation(clean_before_items), 0, tag("clean_before_items"))
+            clean_after_re = patterns.compile(_literal_alternation(clean_after_items), 0, tag("clean_after_items"))
+        else:
+            clean_before_re = patterns.compile(get_cfg("clean_before_regex", ""), re.DOTALL, tag("clean_before_regex"))
+            clean_after_re = patterns.compile(get_cfg("clean_after_regex", ""), re.DOTALL, tag("clean_after_regex"))
+
+        return cls(
+            enable_group_split=bool(get_cfg("enable_group_split", True)),
+            split_scope=get_cfg("split_scope", "llm_only"),
+            max_length_no_split=_to_int(get_cfg("max_length_no_split", 0), 0),
+            max_length_to_disable=_to_int(get_cfg("max_length_to_disable", 0), 0),
+            conversation_blacklist=frozenset(_to_str_tuple(get_cfg("conversation_blacklist", []))),
+            conversation_whitelist=frozenset(_to_str_tuple(get_cfg("conversation_whitelist", []))),
+            split_mode=split_mode,
+            split_pattern=split_pattern,
+            split_re=split_re,
+            split_lookahead=_delimiter_lookahead(split_re),
+            enable_smart_split=bool(get_cfg("enable_smart_split", True)),
+            protect_tags=protect_tags,
+            protected=ProtectedTags(_ZWSP_TAGS + _BUILTIN_PROTECT_TAGS + custom_tags) if custom_tags else _DEFAULT_PROTECTED,
+            stream_split=bool(get_cfg("stream_split", False)),
+            balanced_split_mode=bool(get_cfg("balanced_split_mode", False)),
+            max_segments=_to_int(get_cfg("max_segments", 7), 7),
+            min_segment_length=_to_int(get_cfg("min_segment_length", 10), 10),
+            balanced_split_ratio_min=_to_float(get_cfg("balanced_split_ratio_min", 0.4), 0.4),
+            balanced_split_ratio_max=_to_float(get_cfg("balanced_split_ratio_max", 0.9), 0.9),
+            trim_segment_edge_blank_lines=bool(get_cfg("trim_segment_edge_blank_lines", True)),
+            clean_before_items=clean_before_items,
+            clean_after_items=clean_after_items,
+            clean_before_re=clean_before_re,
+            clean_after_re=clean_after_re,
+            clean_before_width=_match_width(clean_before_re) if clean_before_re is not None else 0,
+            inject_kaomoji_prompt=bool(get_cfg("inject_kaomoji_prompt", True)),
+            enable_smart_reply=bool(get_cfg("enable_smart_reply", False)),
+            enable_reply=bool(get_cfg("enable_reply", True)),
+            strategies=MappingProxyType({
+                "image": get_cfg("image_strategy", "单独"),
+                "at": get_cfg("at_strategy", "跟随下段"),
+                "face": get_cfg("face_strategy", "嵌入"),
+                "default": get_cfg("other_media_strategy", "跟随下段"),
+            }),
+            max_tracked_conversations=max(0, _to_int(get_cfg("max_tracked_conversations", 10000), 10000)),
+            conversation_idle_ttl=_to_float(get_cfg("conversation_idle_ttl", 86400), 86400.0),
+            tts_concurrency=max(1, _to_int(get_cfg("tts_concurrency", 3), 3)),
+            tts_cache_size=max(0, _to_int(get_cfg("tts_cache_size", 128), 128)),
+            tts_cache_ttl=_to_float(get_cfg("tts_cache_ttl", 600), 600.0),
+            delay_strategy=get_cfg("delay_strategy", "linear"),
+            linear_base=_to_float(get_cfg("linear_base", 0.5), 0.5),
+            linear_factor=_to_float(get_cfg("linear_factor", 0.1), 0.1),
+            log_base=_to_float(get_cfg("log_base", 0.5), 0.5),
+            log_factor=_to_float(get_cfg("log_factor", 0.8), 0.8),
+            random_min=_to_float(get_cfg("random_min", 1.0), 1.0),
+            random_max=_to_float(get_cfg("random_max", 3.0), 3.0),
+            fixed_delay=_to_float(get_cfg("fixed_delay", 1.5), 1.5),
+            async_delivery=bool(get_cfg("async_delivery", True)),
+            max_concurrent_deliveries=max(1, _to_int(get_cfg("max_concurrent_deliveries", 8), 8)),
+            new_reply_policy=get_cfg("new_reply_policy", "queue"),
+            send_rate_limit=max(0.0, _to_float(get_cfg("send_rate_limit", 0), 0.0)),
+            send_rate_burst=max(1, _to_int(get_cfg("send_rate_burst", 5), 5)),
+            platform_rate_limits=_parse_rate_overrides(_to_str_tuple(get_cfg("platform_rate_limits", []))),
+            send_retry_times=max(0, _to_int(get_cfg("send_retry_times", 2), 2)),
+            send_retry_backoff=max(0.0, _to_float(get_cfg("send_retry_backoff", 1.0), 1.0)),
+            enable_tts_for_segments=bool(get_cfg("enable_tts_for_segments", True)),
+            enable_metrics=bool(get_cfg("enable_metrics", False)),
+            metrics_dump_path=str(get_cfg("metrics_dump_path", "") or "").strip(),
+            metrics_dump_interval=max(1.0, _to_float(get_cfg("metrics_dump_interval", 60), 60.0)),
+            offload_threshold=max(0, _to_int(get_cfg("offload_threshold", 20000), 20000)),
+            offload_executor=get_cfg("offload_executor", "thread"),
+            split_cache_size=max(0, _to_int(get_cfg("split_cache_size", 256), 256)),
+        )
+
+
+def _parse_profiles(raw: Any) -> Dict[str, Dict[str, Any]]:
+    """解析配置方案 JSON：{"方案名": {"配置项": 值, ...}}，只保留方案可覆盖的配置项。"""
+    if isinstance(raw, dict): data = raw
+    else:
+        text = str(raw or "").strip()
+        if not text: return {}
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            logger.error("[Splitter] 配置方案不是合法的 JSON，已忽略: {}".format(e))
+            return {}
+    if not isinstance(data, dict):
+        logger.error("[Splitter] 配置方案应为“方案名: 配置项”的 JSON 对象，已忽略")
+        return {}
+    profiles = {}
+    for name, overrides in data.items():
+        if not isinstance(overrides, dict):
+            logger.warning("[Splitter] 配置方案 {} 不是 JSON 对象，已忽略".format(name)); continue
+        unknown = sorted(set(overrides) - PROFILE_KEYS)
+        if unknown: logger.warning("[Splitter] 配置方案 {} 中的配置项不支持按会话设置，已忽略: {}".format(name, ", ".join(unknown)))
+        profiles[str(name)] = {k: v for k, v in overrides.items() if k in PROFILE_KEYS}
+    return profiles
+
+
+class ProfileRouter:
+    """
+    按规则把会话路由到预编译的配置快照，优先级：指定会话 > 平台 > 群聊/私聊 > 全局配置。
+    规则在加载时编译为字典，解析结果按会话缓存（LRU 限量），每条回复只有一次字典查找。
+    规则格式为“条件=方案名”，条件可为完整会话 ID、platform:平台 ID、scope:group 或 scope:private。
+    """
+
+    def __init__(self, default: SplitterSettings, profiles: Mapping[str, SplitterSettings], rules: Tuple[str, ...] = (), max_conversations: int = 10000):
+        self.default = default
+        self.max_conversations = max_conversations
+        self._exact: Dict[str, SplitterSettings] = {}
+        self._platform: Dict[str, SplitterSettings] = {}
+        self._scope: Dict[str, SplitterSettings] = {}
+        for rule in rules:
+            cond, sep, name = rule.rpartition("=")
+            cond = cond.strip(); profile = profiles.get(name.strip())
+            if not sep or not cond or profile is None:
+                logger.warning("[Splitter] 配置方案规则无效或方案不存在，已忽略: {}".format(rule)); continue
+            if cond.startswith("platform:"): self._platform[cond[len("platform:"):].strip()] = profile
+            elif cond in ("scope:group", "scope:private"): self._scope[cond[len("scope:"):]] = profile
+            else: self._exact[cond] = profile
+        self._routed = bool(self._exact or self._platform or self._scope)
+        self._cache: "OrderedDict[str, SplitterSettings]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def resolve(self, umo: str) -> SplitterSettings:
+        if not self._routed: return self.default
+        cfg = self._cache.get(umo)
+        if cfg is not None:
+            self._cache.move_to_end(umo)
+            return cfg
+        cfg = self._match(umo)
+        self._cache[umo] = cfg
+        while len(self._cache) > self.max_conversations > 0: self._cache.popitem(last=False)
+        return cfg
+
+    def _match(self, umo: str) -> SplitterSettings:
+        cfg = self._exact.get(umo)
+        if cfg is not None: return cfg
+        # 会话 ID 形如“平台 ID:消息类型:会话”
+        platform, _, rest = umo.partition(":")
+        cfg = self._platform.get(platform)
+        if cfg is not None: return cfg
+        message_type = rest.partition(":")[0]
+        cfg = self._scope.get("group" if message_type.startswith("Group") else "private")
+        return cfg if cfg is not None else self.default
+
+
+class _ConversationState:
+    __slots__ = ("seq", "positions", "last_mark", "touched")
+
+    def __init__(self, now: float):
+        self.seq = 0
+        self.positions: Dict[str, int] = {}
+        self.last_mark = ""
+        self.touched = now
+
+
+class ConversationTracker:
+    """
+    智能回复所需的会话消息序号表。
+    每个会话维护单调递增序号与 message_id -> 序号 映射，“某条消息之后又来了几条”
+    即一次减法；只保留最近 history 条记录，整体按 LRU 与空闲时长淘汰会话。
+    """
+
+    def __init__(self, max_conversations: int = 10000, idle_ttl: float = 86400.0, history: int = 200):
+        self._states: "OrderedDict[str, _ConversationState]" = OrderedDict()
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.history = history
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _touch(self, key: str) -> _ConversationState:
+        now = time.monotonic()
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _ConversationState(now)
+        else:
+            self._states.move_to_end(key)
+            state.touched = now
+        self._evict(now)
+        return state
+
+    def _evict(self, now: float) -> None:
+        states = self._states
+        while len(states) > self.max_conversations > 0:
+            states.popitem(last=False)
+        if self.idle_ttl > 0:
+            deadline = now - self.idle_ttl
+            while states:
+                oldest = next(iter(states.values()))
+                if oldest.touched >= deadline: break
+                states.popitem(last=False)
+
+    def _advance(self, state: _ConversationState) -> None:
+        state.seq += 1
+        # 字典按插入顺序即序号顺序，超出窗口的旧记录从头部弹出
+        positions = state.positions
+        floor = state.seq - self.history
+        while positions:
+            first = next(iter(positions))
+            if positions[first] > floor: break
+            del positions[first]
+
+    def record_message(self, key: str, message_id: str) -> None:
+        state = self._touch(key)
+        self._advance(state)
+        # 同一 message_id 重复出现时以最早一次为准
+        state.positions.setdefault(message_id, state.seq)
+
+    def record_reply(self, key: str, mark: str) -> None:
+        state = self._touch(key)
+        if state.last_mark != mark:
+            self._advance(state)
+            state.last_mark = mark
+
+    def pushed_after(self, key: str, message_id: str) -> int:
+        """返回该消息之后新增的记录数；消息未被记录（或已淘汰）时返回 -1。"""
+        state = self._states.get(key)
+        if state is None: return -1
+        pos = state.positions.get(message_id)
+        if pos is None: return -1
+        return state.seq - pos
+
+
+class TTSAudioCache:
+    """
+    TTS 合成结果缓存：按 (provider, text) 复用正在进行或已完成的合成任务，
+    LRU 淘汰并带过期时间；失败或音频文件已被清理的条目会被丢弃。
+    """
+
+    def __init__(self, max_size: int = 128, ttl: float = 600.0):
+        self._items: "OrderedDict[Tuple[str, str], Tuple[float, asyncio.Task]]" = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key: Tuple[str, str]) -> Optional[asyncio.Task]:
+        item = self._items.get(key)
+        if item is None: return None
+        expires_at, task = item
+        if expires_at < time.monotonic() or not self._usable(task):
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return task
+
+    def put(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self.max_size <= 0: return
+        self._items[key] = (time.monotonic() + self.ttl, task)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    @staticmethod
+    def _usable(task: asyncio.Task) -> bool:
+        if not task.done(): return True
+        if task.cancelled() or task.exception() is not None: return False
+        path = task.result()
+        if not path: return False
+        return str(path).startswith(("http://", "https://")) or os.path.exists(str(path))
+
+
+class SegmentDeliveryScheduler:
+    """
+    分段发送调度器：每个会话一个后台任务按提交顺序串行投递，
+    跨会话通过信号量限制同时进行的发送数量。
+    """
+
+    def __init__(self, max_concurrency: int = 8):
+        self._queues: Dict[str, deque] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._generations: Dict[str, int] = {}
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+        self._closing = False
+
+    def slot(self) -> asyncio.Semaphore:
+        """发送单段消息时需持有的并发名额（`async with scheduler.slot():`）。"""
+        return self._slots
+
+    def is_busy(self, key: str) -> bool:
+        return key in self._workers
+
+    async def join(self, key: str) -> None:
+        """等待该会话当前排队的分段全部发送完毕。"""
+        while key in self._workers:
+            await asyncio.shield(self._workers[key])
+
+    def submit(self, key: str, job: Callable[[Callable[[], bool]], Awaitable[None]], replace: bool = False) -> bool:
+        """
+        提交一次回复的投递任务。job 接收 is_stale 回调，应在每段发送前检查，
+        为 True 时放弃剩余分段。replace 为 True 时丢弃该会话尚未完成的旧回复。
+        """
+        if self._closing: return False
+        if replace:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            pending = self._queues.get(key)
+            if pending: pending.clear()
+        generation = self._generations.get(key, 0)
+        self._queues.setdefault(key, deque()).append((generation, job))
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run(key))
+        return True
+
+    async def _run(self, key: str) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                generation, job = queue.popleft()
+                is_stale = lambda g=generation: self._generations.get(key, 0) != g
+                if is_stale(): continue
+                try:
+                    await job(is_stale)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error("[Splitter] 后台发送任务异常: {}".format(e))
+        finally:
+            self._workers.pop(key, None)
+            if not queue:
+                self._queues.pop(key, None)
+                self._generations.pop(key, None)
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """停止接收新任务，等待已排队的分段发完；超时后取消剩余任务。"""
+        self._closing = True
+        workers = list(self._workers.values())
+        if not workers: return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending: task.cancel()
+        if pending:
+            logger.warning("[Splitter] 卸载时仍有 {} 个会话的分段未发送完毕，已取消".format(len(pending)))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _parse_rate_overrides(items: Tuple[str, ...]) -> Mapping[str, Tuple[float, int]]:
+    """解析“平台名=每秒条数[/突发条数]”形式的平台限速配置，无效项记录警告后忽略。"""
+    out = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            if not sep or not name.strip(): raise ValueError
+            out[name.strip().lower()] = (float(rate), int(burst) if burst.strip() else 0)
+        except ValueError:
+            logger.warning("[Splitter] 平台限速配置格式应为“平台名=每秒条数[/突发条数]”，已忽略: {}".format(item))
+    return MappingProxyType(out)
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "queues", "task")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # 会话 -> 等待放行的 Future，按会话轮询保证公平
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()
+        self.task: Optional[asyncio.Task] = None
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class SendRateLimiter:
+    """
+    分段发送限速：按 (平台, 机器人账号) 维护令牌桶，令牌不足时排队等待。
+    同一个桶内按会话轮询放行，单个长回复不会占满配额；rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate: float = 0.0, burst: int = 5, overrides: Optional[Mapping[str, Tuple[float, int]]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}
+        self._buckets: Dict[Tuple[str, str], _TokenBucket] = {}
+
+    def depth(self) -> int:
+        """当前排队等待令牌的分段数。"""
+        return sum(len(q) for b in self._buckets.values() for q in b.queues.values())
+
+    def _bucket(self, key: Tuple[str, str]) -> Optional[_TokenBucket]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate, burst = self.overrides.get(key[0].lower(), (self.rate, self.burst))
+            if rate <= 0: return None
+            bucket = self._buckets[key] = _TokenBucket(rate, burst or self.burst)
+        return bucket
+
+    async def acquire(self, key: Tuple[str, str], conversation: str) -> float:
+        """取得一次发送配额，返回等待秒数。"""
+        bucket = self._bucket(key)
+        if bucket is None: return 0.0
+        if not bucket.queues:
+            bucket.refill()
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0.0
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        bucket.queues.setdefault(conversation, deque()).append(future)
+        if bucket.task is None: bucket.task = asyncio.create_task(self._dispatch(bucket))
+        await future
+        return time.monotonic() - start
+
+    async def _dispatch(self, bucket: _TokenBucket) -> None:
+        try:
+            while bucket.queues:
+                bucket.refill()
+                if bucket.tokens < 1:
+                    await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+                    continue
+                conversation, waiters = next(iter(bucket.queues.items()))
+                future = waiters.popleft()
+                if waiters: bucket.queues.move_to_end(conversation)
+                else: del bucket.queues[conversation]
+                # 等待方已被取消时不消耗令牌
+                if future.done(): continue
+                bucket.tokens -= 1
+                future.set_result(None)
+        finally:
+            bucket.task = None
+
+    def close(self) -> None:
+        for bucket in self._buckets.values():
+            if bucket.task is not None: bucket.task.cancel()
+            for waiters in bucket.queues.values():
+                for future in waiters: future.cancel()
+            bucket.queues.clear()
+
+
+class SplitOffloader:
+    """
+    超长回复的切分卸载：文本达到阈值时，把纯文本切分核心交给线程池或进程池执行，
+    事件循环在此期间继续处理其他对话；threshold <= 0 表示不卸载。
+    进程池不可用（平台不支持、任务无法序列化或子进程异常退出）时退回线程池，只报告一次。
+    """
+
+    def __init__(self, threshold: int = 0, mode: str = "thread", workers: int = 2):
+        self.threshold = threshold
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._pool: Optional[Executor] = None
+
+    def wants(self, chars: int) -> bool:
+        return self.threshold > 0 and chars >= self.threshold
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process": self._pool = ProcessPoolExecutor(self.workers)
+            else: self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="splitter")
+        return self._pool
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop(); call = functools.partial(func, *args)
+        try:
+            return await loop.run_in_executor(self._executor(), call)
+        except Exception as e:
+            if self.mode != "process": raise
+            logger.warning("[Splitter] 进程池切分不可用，改用线程池: {}".format(e))
+            self.close(); self.mode = "thread"
+            return await loop.run_in_executor(self._executor(), call)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# 耗时直方图分桶上界（秒）；分段数、字数直方图分桶上界
+_DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_SEGMENT_BUCKETS = (1, 2, 3, 5, 7, 10, 15, 20, 50)
+_CHAR_BUCKETS = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+# 统计的处理阶段（顺序即展示顺序）；total 为装饰阶段总耗时，其后各项按段记录
+METRIC_STAGES = ("pre_clean", "split", "merge", "post_clean", "total", "tts", "rate_wait", "send", "delay")
+
+
+class _Histogram:
+    __slots__ = ("bounds", "buckets", "count", "sum", "max")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max: self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按分桶上界估算分位数（不超过观测到的最大值）。"""
+        if not self.count: return 0.0
+        rank = q * self.count; seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank: return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+
+class _ConversationMetrics:
+    __slots__ = ("replies", "segments", "chars", "send_failures", "latency")
+
+    def __init__(self):
+        self.replies = 0
+        self.segments = 0
+        self.chars = 0
+        self.send_failures = 0
+        self.latency = _Histogram(_DURATION_BUCKETS)
+
+
+class _ReplyTimer:
+    """单次回复的分阶段计时：lap(stage) 记录距上一次 lap 的耗时。"""
+    __slots__ = ("_metrics", "key", "started", "_last")
+
+    def __init__(self, metrics: "SplitterMetrics", key: str):
+        self._metrics = metrics
+        self.key = key
+        self.started = self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        self._last = self._metrics.lap(stage, self._last)
+
+    def finish(self, segments: int, chars: int) -> None:
+        now = time.perf_counter()
+        self._metrics.lap("total", self.started)
+        self._metrics.finish_reply(self.key, segments, chars, now - self.started)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage: str) -> None: pass
+
+    def finish(self, segments: int, chars: int) -> None: pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class SplitterMetrics:
+    """
+    分段耗时与计数统计。关闭时 start() 返回空计时器，热路径只多一次空方法调用。
+    全局按阶段汇总耗时直方图；每个会话只保留回复耗时直方图与计数，按 LRU 限量。
+    """
+
+    def __init__(self, enabled: bool = False, max_conversations: int = 10000, dump_path: str = "", dump_interval: float = 60.0, queue_depth: Callable[[], int] = lambda: 0, cache_stats: Callable[[], Tuple[int, int, int]] = lambda: (0, 0, 0)):
+        self.enabled = enabled
+        self.queue_depth = queue_depth
+        self.cache_stats = cache_stats
+        self.max_conversations = max_conversations
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.stages = {name: _Histogram(_DURATION_BUCKETS) for name in METRIC_STAGES}
+        self.segments = _Histogram(_SEGMENT_BUCKETS)
+        self.chars = _Histogram(_CHAR_BUCKETS)
+        self.replies = 0
+        self.sends = 0
+        self.send_retries = 0
+        self.send_failures = 0
+        self._conversations: "OrderedDict[str, _ConversationMetrics]" = OrderedDict()
+        self._last_dump = time.monotonic()
+        self._dump_task: Optional[asyncio.Future] = None
+
+    def start(self, key: str):
+        return _ReplyTimer(self, key) if self.enabled else _NULL_TIMER
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.stages[stage].observe(seconds)
+
+    def lap(self, stage: str, since: float) -> float:
+        """记录 since 至今的耗时到指定阶段，返回当前时刻便于连续计时。"""
+        now = time.perf_counter()
+        self.stages[stage].observe(now - since)
+        return now
+
+    def _conversation(self, key: str) -> _ConversationMetrics:
+        conv = self._conversations.get(key)
+        if conv is None:
+            conv = self._conversations[key] = _ConversationMetrics()
+            while len(self._conversations) > self.max_conversations > 0:
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(key)
+        return conv
+
+    def finish_reply(self, key: str, segments: int, chars: int, elapsed: float) -> None:
+        self.replies += 1
+        self.segments.observe(segments)
+        self.chars.observe(chars)
+        conv = self._conversation(key)
+        conv.replies += 1
+        conv.segments += segments
+        conv.chars += chars
+        conv.latency.observe(elapsed)
+        self.maybe_dump()
+
+    def record_send(self, key: str, ok: bool) -> None:
+        self.sends += 1
+        if ok: return
+        self.send_failures += 1
+        self._conversation(key).send_failures += 1
+
+    def render_text(self, key: str = "") -> str:
+        lines = ["[分段统计] 回复 {} 条，发送 {} 段，重试 {} 次，失败 {} 段，限速排队 {} 段".format(
+            self.replies, self.sends, self.send_retries, self.send_failures, self.queue_depth())]
+        if self.replies:
+            lines.append("每条回复：平均 {:.1f} 段 / {:.0f} 字，p99 {:g} 段 / {:g} 字".format(
+                self.segments.sum / self.replies, self.chars.sum / self.replies,
+                self.segments.quantile(0.99), self.chars.quantile(0.99)))
+        hits, misses, size = self.cache_stats()
+        if hits or misses:
+            lines.append("切分缓存：命中 {} 次，未命中 {} 次（命中率 {:.0%}），缓存 {} 条".format(hits, misses, hits / (hits + misses), size))
+        lines.append("阶段耗时(ms)：次数 平均 p50 p99 最大")
+        for name in METRIC_STAGES:
+            h = self.stages[name]
+            if not h.count: continue
+            lines.append("  {} {} {:.2f} {:.2f} {:.2f} {:.2f}".format(
+                name, h.count, h.sum / h.count * 1e3, h.quantile(0.5) * 1e3, h.quantile(0.99) * 1e3, h.max * 1e3))
+        conv = self._conversations.get(key)
+        if conv is not None and conv.replies:
+            lines.append("当前会话：回复 {} 条，平均 {:.1f} 段 / {:.0f} 字，失败 {} 段，处理耗时 p50 {:.2f} ms".format(
+                conv.replies, conv.segments / conv.replies, conv.chars / conv.replies,
+                conv.send_failures, conv.latency.quantile(0.5) * 1e3))
+        return "\n".join(lines)
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def histogram(name: str, help_text: str, items) -> None:
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} histogram".format(name))
+            for labels, h in items:
+                cumulative = 0
+                for bound, n in zip(h.bounds + ("+Inf",), h.buckets):
+                    cumulative += n
+                    lines.append('{}_bucket{{{}le="{}"}} {}'.format(name, labels, bound, cumulative))
+                suffix = "{{{}}}".format(labels.rstrip(",")) if labels else ""
+                lines.append("{}_sum{} {}".format(name, suffix, h.sum))
+                lines.append("{}_count{} {}".format(name, suffix, h.count))
+
+        histogram("splitter_stage_seconds", "Duration of each splitting stage.",
+                  (('stage="{}",'.format(n), self.stages[n]) for n in METRIC_STAGES))
+        histogram("splitter_reply_segments", "Segments produced per reply.", (("", self.segments),))
+        histogram("splitter_reply_chars", "Characters per split reply.", (("", self.chars),))
+        hits, misses, size = self.cache_stats()
+        for name, value, help_text in (
+            ("splitter_replies_total", self.replies, "Replies split."),
+            ("splitter_sends_total", self.sends, "Segments sent."),
+            ("splitter_send_retries_total", self.send_retries, "Send attempts retried after a failure."),
+            ("splitter_send_failures_total", self.send_failures, "Segments that failed to send."),
+            ("splitter_split_cache_hits_total", hits, "Replies whose segments were taken from the split cache."),
+            ("splitter_split_cache_misses_total", misses, "Cacheable replies that had to be split."),
+        ):
+            lines += ["# HELP {} {}".format(name, help_text), "# TYPE {} counter".format(name), "{} {}".format(name, value)]
+        lines += ["# HELP splitter_send_queue_depth Segments waiting for a rate limit token.",
+                  "# TYPE splitter_send_queue_depth gauge", "splitter_send_queue_depth {}".format(self.queue_depth()),
+                  "# HELP splitter_split_cache_entries Segment layouts held in the split cache.",
+                  "# TYPE splitter_split_cache_entries gauge", "splitter_split_cache_entries {}".format(size)]
+        return "\n".join(lines) + "\n"
+
+    def _write_dump(self, text: str) -> None:
+        tmp = self.dump_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write(text)
+        os.replace(tmp, self.dump_path)
+
+    def maybe_dump(self, force: bool = False) -> None:
+        """按间隔把 Prometheus 文本格式写入 dump_path（写文件在线程池中进行）。"""
+        if not self.dump_path: return
+        now = time.monotonic()
+        if not force and now - self._last_dump < self.dump_interval: return
+        if self._dump_task is not None and not self._dump_task.done(): return
+        self._last_dump = now
+        text = self.render_prometheus()
+        try:
+            if force: self._write_dump(text); return
+            self._dump_task = asyncio.get_running_loop().run_in_executor(None, self._write_dump, text)
+            self._dump_task.add_done_callback(self._dump_done)
+        except (OSError, RuntimeError) as e:
+            logger.error("[Splitter] 写入统计文件失败: {}".format(e))
+
+    @staticmethod
+    def _dump_done(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("[Splitter] 写入统计文件失败: {}".format(future.exception()))
+
+
+class Segment:
+    """
+    切分结果的紧凑表示。items 中的文本为 (原文, 起点, 终点) 区间，直接引用切分前的字符串；
+    其余为原样引用的消息组件。后处理只移动区间端点，发送时才由 materialize() 生成 Plain。
+    chars（文本长度）与 visible（文本是否含可见字符）由 measure() 在后处理末尾算出。
+    """
+    __slots__ = ("items", "chars", "visible")
+
+    def __init__(self, items: list):
+        self.items = items
+        self.chars = 0
+        self.visible = False
+
+    @classmethod
+    def of_text(cls, text: str) -> "Segment":
+        return cls([(text, 0, len(text))])
+
+    @property
+    def blank(self) -> bool:
+        """既无可见文本也无其他组件的空段，不发送。"""
+        return not self.visible and all(type(item) is tuple for item in self.items)
+
+    def text(self) -> str:
+        return "".join(item[0][item[1]:item[2]] for item in self.items if type(item) is tuple)
+
+    def measure(self) -> None:
+        chars = 0; visible = False
+        for item in self.items:
+            if type(item) is not tuple: continue
+            src, start, end = item
+            chars += end - start
+            if not visible and _VISIBLE_CHAR_RE.search(src, start, end): visible = True
+        self.chars = chars; self.visible = visible
+
+    def materialize(self) -> List[BaseMessageComponent]:
+        return [Plain(item[0][item[1]:item[2]]) if type(item) is tuple else item for item in self.items]
+
+
+def _join_text_items(items: list) -> list:
+    """相邻文本合并为一项（同一原文且首尾相接时只移动端点），避免合并后的文本被拆成多个组件。"""
+    out = []
+    for item in items:
+        if out and type(item) is tuple and type(out[-1]) is tuple:
+            src, start, end = out[-1]
+            if src is item[0] and end == item[1]: out[-1] = (src, start, item[2]); continue
+            joined = src[start:end] + item[0][item[1]:item[2]]
+            out[-1] = (joined, 0, len(joined))
+        else: out.append(item)
+    return out
+
+
+class SplitCache:
+    """
+    切分结果缓存：按“配置指纹 + 消息链各组件的文本或类型”做 LRU，命中时跳过前置清理、切分与合并。
+    缓存的是分段布局：文本为清理后原文上的区间，其他组件记为其在消息链中的下标，
+    取出时按当前消息链重新组装，每次得到互不共享的新分段。size <= 0 表示不缓存；
+    超过 max_chars 的回复重复概率低，不缓存。
+    """
+
+    def __init__(self, size: int = 256, max_chars: int = 8000):
+        self.size = size
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Tuple[tuple, tuple]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Tuple[int, int, int]:
+        return self.hits, self.misses, len(self._entries)
+
+    def wants(self, chars: int) -> bool:
+        return self.size > 0 and chars <= self.max_chars
+
+    @staticmethod
+    def key(fingerprint: Tuple, chain: List[BaseMessageComponent]) -> Tuple:
+        return fingerprint, tuple(c.text if isinstance(c, Plain) else type(c) for c in chain)
+
+    def get(self, key: Tuple, chain: List[BaseMessageComponent]) -> Optional[List[Segment]]:
+        """命中时把清理后的文本写回消息链并返回重新组装的分段。"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        texts, layout = entry
+        for comp, text in zip(chain, texts):
+            if text is not None: comp.text = text
+        return [Segment([item if type(item) is tuple else chain[item] for item in seg]) for seg in layout]
+
+    def put(self, key: Tuple, chain: List[BaseMessageComponent], segments: List[Segment]) -> None:
+        positions = {id(c): k for k, c in enumerate(chain)}
+        layout = tuple(tuple(item if type(item) is tuple else positions[id(item)] for item in seg.items) for seg in segments)
+        self._entries[key] = (tuple(c.text if isinstance(c, Plain) else None for c in chain), layout)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size: self._entries.popitem(last=False)
+
+
+class StreamingSplitter:
+    """
+    流式增量分段器：feed(delta) 返回本次新确认的完整分段，finish() 返回剩余分段。
+    只扫描新收到的文本：记录上次扫描停下的位置及该处的成对符号栈，从那里继续；
+    未闭合的受保护区间只在新文本中查找结束标记，闭合前收到的文本暂存不扫描。
+    切分点之后需已收到足以判定分隔符结束的字符才视为确认，因此结果与整段一次性切分一致。
+    配置了前置清理时，末尾按清理正则的最大匹配宽度（封顶 32 字）留出的文本与未闭合的受保护区间暂不清理，
+    区间闭合后整体清理一次；单次匹配超过该宽度且不从受保护标记开始的清理正则，结果可能与整段清理不同。
+    依赖全文长度的均分模式不适用。
+    """
+
+    # 长时间没有切分点时，已扫描的文本移出待扫描串，避免每次追加都复制整段
+    _FLUSH_CHARS = 4096
+
+    def __init__(self, settings: SplitterSettings):
+        self._settings = settings
+        protected = settings.protected if settings.enable_smart_split else _ZWSP_PROTECTED
+        # 扫描停在距末尾 margin 之前：分隔符可判定已结束，受保护标记也已收全
+        self._margin = max([settings.split_lookahead] + [len(o) for o in protected.closers])
+        self._limit = settings.max_segments - 1 if settings.max_segments > 0 else None
+        self.emitted = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        # 当前段已扫描并移出的开头部分、待扫描文本、下次扫描的起点及该处的成对符号栈
+        self._head: List[str] = []
+        self._pending = ""
+        self._resume = 0
+        self._stack: list = []
+        # 扫描停在未闭合的受保护区间起点时：(结束标记, 已收文本末尾可能构成结束标记前缀的部分)，其后的文本暂存于 _held
+        self._open: Optional[Tuple[str, str]] = None
+        self._held: List[str] = []
+        # 尚未清理的末尾文本；开头为未闭合区间时同样只在新文本中查找结束标记
+        self._raw = ""
+        self._raw_open: Optional[Tuple[str, str]] = None
+        self._raw_held: List[str] = []
+
+    @staticmethod
+    def _closes(state: Tuple[str, str], delta: str) -> Tuple[bool, Tuple[str, str]]:
+        """结束标记是否出现在新文本中（含与之前末尾拼接的情况），返回结果与更新后的状态。"""
+        closer, tail = state
+        window = tail + delta
+        keep = len(closer) - 1
+        return closer in window, (closer, window[len(window) - keep:] if keep else "")
+
+    def feed(self, delta: str) -> List[str]:
+        if not delta: return []
+        if self._settings.clean_before_re is not None:
+            delta = self._clean(delta)
+            if not delta: return []
+        if self._limit is not None and self.emitted >= self._limit:
+            # 已达最大段数，其余文本全部留给末段
+            self._held.append(delta); return []
+        if self._open is not None:
+            closed, self._open = self._closes(self._open, delta)
+            if not closed:
+                self._held.append(delta); return []
+            self._open = None
+        if self._held:
+            delta = "".join(self._held) + delta; self._held = []
+        self._pending += delta
+        return self._take(final=False)
+
+    def finish(self) -> List[str]:
+        """
+        流结束或遇到非文本片段：切出已收到的全部文本，最后一项为末段（可能为空串）。
+        之后的文本从空的成对符号栈重新开始。
+        """
+        if self._held: self._pending += "".join(self._held)
+        if self._raw or self._raw_held: self._pending += self._clean("", final=True)
+        pieces = self._take(final=True)
+        pieces.append("".join(self._head) + self._pending)
+        self._reset()
+        return pieces
+
+    def _clean(self, delta: str, final: bool = False) -> str:
+        """前置清理新收到的文本，返回已可确定清理结果的部分，其余留待后续文本到达。"""
+        cfg = self._settings; clean_re = cfg.clean_before_re
+        if self._raw_open is not None and not final:
+            # 未闭合的受保护区间可能在闭合后被整体删除，闭合前不清理
+            closed, self._raw_open = self._closes(self._raw_open, delta)
+            if not closed:
+                self._raw_held.append(delta); return ""
+            self._raw_open = None
+        if self._raw_held:
+            delta = "".join(self._raw_held) + delta; self._raw_held = []
+        raw = self._raw + delta
+        if final:
+            self._raw = ""; self._raw_open = None
+            return clean_re.sub("", raw)
+        stable = len(raw) - cfg.clean_before_width
+        opened = cfg.protected.unclosed_start(raw)
+        if opened is not None: stable = min(stable, opened)
+        out = []; pos = 0
+        for m in clean_re.finditer(raw):
+            if m.start() >= stable: break
+            out.append(raw[pos:m.start()]); pos = m.end()
+        end = max(pos, stable)
+        out.append(raw[pos:end])
+        self._raw = raw[end:]
+        if opened is not None and end == opened:
+            m = cfg.protected.opener_re.match(raw, opened)
+            closer = cfg.protected.closers.get(m.group()) if m else None
+            if closer is not None: self._raw_open = (closer, raw[max(m.end(), len(raw) - len(closer) + 1):])
+        return "".join(out)
+
+    def _take(self, final: bool) -> List[str]:
+        cfg = self._settings; limit = self._limit
+        if limit is not None and self.emitted >= limit: return []
+
+        pending = self._pending; n = len(pending)
+        stop = None if final else n - self._margin
+        if stop is not None and stop <= self._resume: return []
+        if cfg.enable_smart_split:
+            cuts, self._resume = _smart_scan(pending, cfg.split_re, self._stack, None, cfg.protected, self._resume, stop)
+            if stop is not None and self._resume < stop:
+                # 停在未闭合的受保护区间起点：记下结束标记，闭合前只在新文本中查找
+                m = cfg.protected.opener_re.match(pending, self._resume)
+                closer = cfg.protected.closers.get(m.group()) if m else None
+                if closer is not None and pending.find(closer, m.end()) == -1:
+                    self._open = (closer, pending[max(m.end(), n - len(closer) + 1):])
+        else:
+            cuts, self._resume = _delimiter_scan(cfg.split_re, pending, self._resume, stop)
+
+        if limit is not None: cuts = cuts[:limit - self.emitted]
+        if not cuts:
+            if self._resume > self._FLUSH_CHARS:
+                # 保留续扫位置前一个字符，供英文语境判断
+                keep = self._resume - 1
+                self._head.append(pending[:keep]); self._pending = pending[keep:]; self._resume -= keep
+            return []
+        pieces = []; last = 0
+        for end in cuts:
+            pieces.append(pending[last:end]); last = end
+        if self._head:
+            pieces[0] = "".join(self._head) + pieces[0]; self._head = []
+        self._pending = pending[last:]
+        self._resume -= last
+        self.emitted += len(pieces)
+        return pieces
+
 
 class MessageSplitterPlugin(Star):
     def __init__(self, context: Context, config: AstrBotConfig):
@@ -20,33 +1613,45 @@ class MessageSplitterPlugin(Star):
         self.config = config
 
         # --- 1. 配置兼容性与迁移逻辑 ---
+        # 配置快照及以下各组件只在此构建一次；WebUI 保存配置后 AstrBot 会重载插件，全部随新实例重建
         self._migrate_config()
+        self._patterns = PatternRegistry()
+        self.settings = SplitterSettings.build(self._get_cfg, self._patterns)
+        # 按会话、平台或群聊/私聊套用的配置方案
+        self._router = self._build_router()
 
-        # 智能回复：按会话缓存消息 ID，供发送前判断“是否被新消息插嘴”
-        self._message_queues = defaultdict(deque)
-        self._last_smart_reply_mark = {}
+        # 分段后台发送：按会话串行、跨会话限流
+        self._delivery = SegmentDeliveryScheduler(self.settings.max_concurrent_deliveries)
+        # 分段 TTS：切分完成后并发预合成，发送时只等待本段结果
+        self._tts_slots = asyncio.Semaphore(self.settings.tts_concurrency)
+        self._tts_cache = TTSAudioCache(self.settings.tts_cache_size, self.settings.tts_cache_ttl)
 
-        # 定义成对出现的字符，在智能分段时避免在这些符号内部切断
-        self.pair_map = {
-            '“': '”', "《": "》", "（": "）", "(": ")",
-            "[": "]", "{": "}", "‘": "’", "【": "】", "<": ">",
-        }
-        # 定义引用/引号字符
-        self.quote_chars = {'"', "'", "`"}
-        self.secondary_pattern = re.compile(r"[，,、；;]+")
+        # 智能回复：按会话缓存消息 ID，供发送前判断“是否被新消息插嘴”
+        self._conversations = ConversationTracker(
+            self.settings.max_tracked_conversations, self.settings.conversation_idle_ttl,
+        )
+        # 按平台与机器人账号限速发送
+        self._rate_limiter = SendRateLimiter(
+            self.settings.send_rate_limit, self.settings.send_rate_burst, self.settings.platform_rate_limits,
+        )
+        # 重复回复（命令输出、帮助文本等）直接复用缓存的分段布局
+        self._split_cache = SplitCache(self.settings.split_cache_size)
+        # 分阶段耗时与计数统计（未开启时不计时）
+        self._metrics = SplitterMetrics(
+            self.settings.enable_metrics, self.settings.max_tracked_conversations,
+            self.settings.metrics_dump_path, self.settings.metrics_dump_interval, self._rate_limiter.depth,
+            self._split_cache.stats,
+        )
+        # 超长回复的清理与切分点扫描放到线程池/进程池执行
+        self._offloader = SplitOffloader(self.settings.offload_threshold, self.settings.offload_executor)
 
     def _get_cfg(self, key: str, default: Any = None) -> Any:
         """
         助手函数：自动从嵌套或扁平结构中获取配置项。
         解决嵌套配置后代码无法读取旧配置或默认值的问题。
         """
-        # 定义分类映射
-        categories = [
-            "basic_settings", "split_settings", "clean_settings", 
-            "reply_media_settings", "delay_settings"
-        ]
         # 1. 尝试从嵌套结构获取
-        for cat in categories:
+        for cat in CONFIG_CATEGORIES:
             cat_obj = self.config.get(cat)
             if isinstance(cat_obj, dict) and key in cat_obj:
                 return cat_obj[key]
@@ -54,6 +1659,19 @@ class MessageSplitterPlugin(Star):
         # 2. 尝试从顶层获取（兼容旧配置或未迁移的情况）
         return self.config.get(key, default)
 
+    def _build_router(self) -> ProfileRouter:
+        """各配置方案在全局配置之上覆盖部分配置项，加载时即编译为独立的配置快照。"""
+        profiles = {}
+        for name, overrides in _parse_profiles(self._get_cfg("config_profiles", "")).items():
+            get_cfg = lambda key, default=None, overrides=overrides: overrides[key] if key in overrides else self._get_cfg(key, default)
+            profiles[name] = SplitterSettings.build(get_cfg, self._patterns, name)
+        rules = _to_str_tuple(self._get_cfg("profile_rules", []))
+        return ProfileRouter(self.settings, profiles, rules, self.settings.max_tracked_conversations)
+
+    def _settings_for(self, event: AstrMessageEvent) -> SplitterSettings:
+        """当前会话生效的配置快照（未命中任何方案规则时为全局配置）。"""
+        return self._router.resolve(event.unified_msg_origin)
+
     def _migrate_config(self):
         """
         处理旧版本配置数据类型冲突及嵌套迁移。
@@ -67,10 +1685,12 @@ class MessageSplitterPlugin(Star):
         # 2. 结构迁移：将顶层的扁平配置移动到嵌套对象中
         mapping = {
             "basic_settings": ["enable_group_split", "split_scope", "max_length_no_split", "max_length_to_disable", "conversation_blacklist", "conversation_whitelist"],
-            "split_settings": ["split_mode", "split_chars", "split_regex", "enable_smart_split", "balanced_split_mode", "max_segments", "min_segment_length", "balanced_split_ratio_min", "balanced_split_ratio_max", "trim_segment_edge_blank_lines"],
+            "split_settings": ["split_mode", "split_chars", "split_regex", "enable_smart_split", "protect_tags", "stream_split", "balanced_split_mode", "max_segments", "min_segment_length", "balanced_split_ratio_min", "balanced_split_ratio_max", "trim_segment_edge_blank_lines"],
             "clean_settings": ["clean_before_items", "clean_after_items", "clean_before_regex", "clean_after_regex", "inject_kaomoji_prompt"],
-            "reply_media_settings": ["enable_smart_reply", "enable_reply", "image_strategy", "at_strategy", "face_strategy", "other_media_strategy"],
-            "delay_settings": ["delay_strategy", "linear_base", "linear_factor", "log_base", "log_factor", "random_min", "random_max", "fixed_delay"]
+            "reply_media_settings": ["enable_smart_reply", "enable_reply", "image_strategy", "at_strategy", "face_strategy", "other_media_strategy", "max_tracked_conversations", "conversation_idle_ttl", "tts_concurrency", "tts_cache_size", "tts_cache_ttl"],
+            "delay_settings": ["delay_strategy", "linear_base", "linear_factor", "log_base", "log_factor", "random_min", "random_max", "fixed_delay", "async_delivery", "max_concurrent_deliveries", "new_reply_policy", "send_rate_limit", "send_rate_burst", "platform_rate_limits", "send_retry_times", "send_retry_backoff"],
+            "profile_settings": ["config_profiles", "profile_rules"],
+            "advanced_settings": ["enable_metrics", "metrics_dump_path", "metrics_dump_interval", "offload_threshold", "offload_executor", "split_cache_size"]
         }
 
         for cat, keys in mapping.items():
@@ -80,7 +1700,7 @@ class MessageSplitterPlugin(Star):
                 if key in self.config and key != cat:
                     val = self.config.pop(key)
                     # 强制类型转换，防止列表配置项变成字符串
-                    list_fields = ["split_chars", "clean_before_items", "clean_after_items", "conversation_blacklist", "conversation_whitelist"]
+                    list_fields = ["split_chars", "clean_before_items", "clean_after_items", "conversation_blacklist", "conversation_whitelist", "platform_rate_limits", "profile_rules", "protect_tags"]
                     if key in list_fields:
                         if isinstance(val, str):
                             val = [val] if key != "split_chars" else list(val)
@@ -91,39 +1711,30 @@ class MessageSplitterPlugin(Star):
     def _get_conversation_key(self, event: AstrMessageEvent) -> str:
         return str(getattr(event, "unified_msg_origin", "") or "")
 
-    def _get_message_queue(self, event: AstrMessageEvent):
-        return self._message_queues[self._get_conversation_key(event)]
-
     def _remember_incoming_message(self, event: AstrMessageEvent) -> None:
         message_id = getattr(event.message_obj, "message_id", None)
         if not message_id: return
-        queue = self._get_message_queue(event)
-        queue.append(str(message_id))
-        if len(queue) > 200: queue.popleft()
+        self._conversations.record_message(self._get_conversation_key(event), str(message_id))
 
     def _mark_bot_reply(self, event: AstrMessageEvent, base_message_id: str) -> None:
         if not base_message_id: return
-        conv_key = self._get_conversation_key(event)
         mark = "__bot_reply__{}".format(base_message_id)
-        queue = self._message_queues[conv_key]
-        if self._last_smart_reply_mark.get(conv_key) != mark:
-            queue.append(mark)
-            self._last_smart_reply_mark[conv_key] = mark
-            if len(queue) > 200: queue.popleft()
+        self._conversations.record_reply(self._get_conversation_key(event), mark)
 
     def _should_add_smart_reply(self, event: AstrMessageEvent) -> bool:
-        if not self._get_cfg("enable_smart_reply", False): return False
+        if not self._settings_for(event).enable_smart_reply: return False
         platform_name = str(getattr(event, "get_platform_name", lambda: "")() or "")
         if platform_name.lower() == "dingtalk": return False
         message_id = getattr(event.message_obj, "message_id", None)
         if not message_id: return False
-        queue = self._get_message_queue(event)
-        queue_str = [str(x) for x in queue]
-        msg_id = str(message_id)
-        if msg_id not in queue_str: return False
-        idx = queue_str.index(msg_id)
-        pushed = len(queue_str) - idx - 1
-        return pushed > 0
+        return self._conversations.pushed_after(self._get_conversation_key(event), str(message_id)) > 0
+
+    def _attach_source_reply(self, event: AstrMessageEvent, first_segment: Segment, source_id: str) -> None:
+        cfg = self._settings_for(event)
+        if cfg.enable_smart_reply:
+            if self._should_add_smart_reply(event): self._prepend_reply(first_segment.items, source_id)
+        elif cfg.enable_reply:
+            self._prepend_reply(first_segment.items, source_id)
 
     def _has_reply_component(self, chain: List[BaseMessageComponent]) -> bool:
         return any(isinstance(c, Reply) for c in chain)
@@ -132,8 +1743,10 @@ class MessageSplitterPlugin(Star):
         if message_id and not self._has_reply_component(chain):
             chain.insert(0, Reply(id=message_id))
 
-    def _remove_reply_components(self, chain: List[BaseMessageComponent]) -> List[BaseMessageComponent]:
-        return [comp for comp in chain if not isinstance(comp, Reply)]
+    def _remove_reply_components(self, segment: Segment) -> Segment:
+        stripped = Segment([item for item in segment.items if not isinstance(item, Reply)])
+        stripped.chars = segment.chars; stripped.visible = segment.visible
+        return stripped
 
     @filter.event_message_type(filter.EventMessageType.ALL, priority=1000)
     async def on_message(self, event: AstrMessageEvent):
@@ -150,7 +1763,9 @@ class MessageSplitterPlugin(Star):
 
     @filter.on_llm_request()
     async def on_llm_request(self, event: AstrMessageEvent, req: ProviderRequest):
-        if not self._get_cfg("inject_kaomoji_prompt", True): return
+        cfg = self._settings_for(event)
+        if cfg.stream_split and not cfg.balanced_split_mode and self._conversation_enabled(event, cfg): self._wrap_streaming(event)
+        if not cfg.inject_kaomoji_prompt: return
         instruction = (
             "\n【特别注意】如果你需要输出颜文字（如 (QAQ)），请务必使用三对反引号包裹，"
             "格式如：```(QAQ)```。这能确保颜文字作为一个整体被发送，不会被分段工具切断。"
@@ -173,287 +1788,543 @@ class MessageSplitterPlugin(Star):
             return type_name in {"LLM_RESULT", "AGENT_RUNNER_ERROR", "AGENT_RUNNER_RESULT", "TOOL_RESULT", "TOOL_CALL"}
         return getattr(event, "__is_llm_reply", False)
 
+    def _is_streaming_finish(self, result) -> bool:
+        content_type = getattr(result, "result_content_type", None)
+        return getattr(content_type, "name", "") == "STREAMING_FINISH"
+
+    def _wrap_streaming(self, event: AstrMessageEvent) -> None:
+        """
+        框架对流式结果不调用结果装饰钩子，流只在发送阶段交给 event.send_streaming；
+        因此在 LLM 请求时替换本事件的 send_streaming，发送前把流包装为 _split_stream。
+        """
+        send_streaming = getattr(event, "send_streaming", None)
+        if send_streaming is None or getattr(event, "__splitter_streamed", False): return
+        setattr(event, "__splitter_streamed", True)
+
+        async def split_and_send(generator, *args, **kwargs):
+            return await send_streaming(self._split_stream(event, generator), *args, **kwargs)
+
+        event.send_streaming = split_and_send
+
+    def _conversation_enabled(self, event: AstrMessageEvent, cfg: SplitterSettings) -> bool:
+        """黑白名单按全局配置（集合查找），群聊开关按会话生效的配置。"""
+        umo = event.unified_msg_origin
+        if umo in self.settings.conversation_blacklist: return False
+        if self.settings.conversation_whitelist and umo not in self.settings.conversation_whitelist: return False
+        if not cfg.enable_group_split and event.message_obj.group_id: return False
+        return True
+
     @filter.on_decorating_result(priority=-100000000000000000)
     async def on_decorating_result(self, event: AstrMessageEvent):
         result = event.get_result()
-        if not result or not result.chain: return
+        if not result: return
         if getattr(result, "__splitter_processed", False): return
+        # 流式输出结束后框架回填的完整结果只用于记录，不会再发送，分段发送会造成重复
+        if self._is_streaming_finish(result): return
+        if not result.chain: return
 
-        # --- 1. 基础校验 ---
-        umo = event.unified_msg_origin
-        blacklist = self._get_cfg("conversation_blacklist", [])
-        whitelist = self._get_cfg("conversation_whitelist", [])
-        if umo in blacklist: return
-        if whitelist and umo not in whitelist: return
-        if not self._get_cfg("enable_group_split", True) and event.message_obj.group_id: return
+        # --- 1. 基础校验（不分段的回复仍需排在该会话后台未发完的分段之后） ---
+        cfg = self._settings_for(event)
+        if not self._conversation_enabled(event, cfg): return await self._enqueue_unsplit(event, result, cfg)
 
-        split_scope = self._get_cfg("split_scope", "llm_only")
         is_llm_reply = self._is_model_generated_reply(event, result)
-        if split_scope == "llm_only" and not is_llm_reply: return
+        if cfg.split_scope == "llm_only" and not is_llm_reply: return await self._enqueue_unsplit(event, result, cfg)
 
         # --- 2. 长度校验 ---
         total_text_len = sum(len(c.text) for c in result.chain if isinstance(c, Plain))
-        max_len_no_split = self._get_cfg("max_length_no_split", 0)
-        if max_len_no_split > 0 and total_text_len < max_len_no_split: return
-        max_len_disable = self._get_cfg("max_length_to_disable", 0)
-        if max_len_disable > 0 and total_text_len > max_len_disable: return
+        if cfg.max_length_no_split > 0 and total_text_len < cfg.max_length_no_split: return await self._enqueue_unsplit(event, result, cfg)
+        if cfg.max_length_to_disable > 0 and total_text_len > cfg.max_length_to_disable: return await self._enqueue_unsplit(event, result, cfg)
 
         setattr(result, "__splitter_processed", True)
-        split_mode = self._get_cfg("split_mode", "regex")
+        conv_key = self._get_conversation_key(event)
+        timer = self._metrics.start(conv_key)
 
-        # --- 3. 分段前清理 ---
-        if split_mode == "simple":
-            for comp in result.chain:
-                if isinstance(comp, Plain) and comp.text:
-                    for item in self._get_cfg("clean_before_items", []):
-                        if item: comp.text = comp.text.replace(item, "")
-        else:
-            regex = self._get_cfg("clean_before_regex", "")
-            if regex:
-                for comp in result.chain:
-                    if isinstance(comp, Plain) and comp.text:
-                        comp.text = re.sub(regex, "", comp.text, flags=re.DOTALL)
-
-        # 脱敏处理
-        has_external_at = False
-        for comp in result.chain:
-            if isinstance(comp, Plain) and comp.text:
-                if "\u200b" in comp.text: has_external_at = True
-                comp.text = comp.text.replace("\u200b \u200b", "__ZWSP_DOUBLE__").replace("\u200b", "__ZWSP_SINGLE__")
-
-        # --- 4. 构建正则 ---
-        if split_mode == "simple":
-            chars = self._get_cfg("split_chars", ["。", "？", "！", "?", "!", "；", ";", "\n"])
-            processed = []
-            for c in chars:
-                if not c: continue
-                processed.append(re.escape(str(c).replace("\\n", "\n").replace("\\t", "\t")))
-            processed.sort(key=len, reverse=True)
-            split_pattern = "(?:{})+".format("|".join(processed)) if processed else r"[\n]+"
-        else:
-            split_pattern = self._get_cfg("split_regex", r"[。？！?!\\n…]+")
-
-        # --- 5. 执行切分 ---
-        strategies = {
-            "image": self._get_cfg("image_strategy", "单独"),
-            "at": self._get_cfg("at_strategy", "跟随下段"),
-            "face": self._get_cfg("face_strategy", "嵌入"),
-            "default": self._get_cfg("other_media_strategy", "跟随下段"),
-        }
-        
-        max_segs = self._get_cfg("max_segments", 7)
-        ideal_length = 0
-        if self._get_cfg("balanced_split_mode", False) and max_segs > 0:
-            text_weight = sum(len(c.text.replace(" ", "")) for c in result.chain if isinstance(c, Plain))
-            solo_count = sum(1 for c in result.chain if not isinstance(c, (Plain, Reply)) and strategies.get(type(c).__name__.lower(), "default") == "单独")
-            target_segs = max(1, max_segs - solo_count)
-            if text_weight > 0:
-                ideal_length = max(math.ceil(text_weight / target_segs), self._get_cfg("min_segment_length", 10))
-
-        segments = self.split_chain_smart(result.chain, split_pattern, self._get_cfg("enable_smart_split", True), strategies, self._get_cfg("enable_reply", True), ideal_length)
-
-        # 强制分段上限控制
-        if max_segs > 0 and len(segments) > max_segs:
-            merged_last = []
-            for seg in segments[max_segs - 1:]:
-                merged_last.extend(seg)
-                
-            optimized_last = []
-            # 合并连贯的 Plain 组件避免由于强制合并导致文本内部被打断
-            for comp in merged_last:
-                if optimized_last and isinstance(comp, Plain) and isinstance(optimized_last[-1], Plain):
-                    optimized_last[-1] = Plain(optimized_last[-1].text + comp.text)
-                else:
-                    optimized_last.append(comp)
-                    
-            segments = segments[:max_segs - 1] + [optimized_last]
-
-        # 均分模式尾部合并
-        if self._get_cfg("balanced_split_mode", False) and len(segments) >= 2:
-            last_text = "".join([c.text for c in segments[-1] if isinstance(c, Plain)]).strip()
-            if 0 < len(last_text) < self._get_cfg("min_segment_length", 10):
-                if not any(not isinstance(c, (Plain, Reply)) for c in segments[-1]):
-                    segments[-2].extend(segments.pop())
-
-        # --- 6. 回复处理 ---
+        # --- 3/4. 清理、切分与合并：相同内容与配置的回复直接取缓存的分段布局（命中耗时记入 split 阶段） ---
+        strategies = cfg.strategies
+        cache = self._split_cache
+        cache_key = cache.key(cfg.split_fingerprint, result.chain) if cache.wants(total_text_len) else None
+        segments = cache.get(cache_key, result.chain) if cache_key is not None else None
+        if segments is None:
+            segments = await self._split_result(cfg, result.chain, total_text_len, timer)
+            if cache_key is not None: cache.put(cache_key, result.chain, segments)
+        else: timer.lap("split")
+
+        # --- 5. 回复处理 ---
         source_id = str(getattr(event.message_obj, "message_id", "") or "")
-        enable_reply = self._get_cfg("enable_reply", True)
-        enable_smart = self._get_cfg("enable_smart_reply", False)
+        enable_reply = cfg.enable_reply
+        enable_smart = cfg.enable_smart_reply
 
-        if segments and source_id:
-            if enable_smart:
-                if self._should_add_smart_reply(event): self._prepend_reply(segments[0], source_id)
-            elif enable_reply:
-                self._prepend_reply(segments[0], source_id)
+        if segments and source_id: self._attach_source_reply(event, segments[0], source_id)
 
-        # --- 7. 后处理 (At/清理/TTS) ---
+        # --- 6. 后处理 (At/清理/TTS) ---
         at_strategy = strategies.get("at", "跟随下段")
         at_needs_proc = at_strategy in ["接下文", "跟随下段", "嵌入"] and any(type(c).__name__.lower() == "at" for c in result.chain)
         
-        for seg in segments:
-            if self._get_cfg("trim_segment_edge_blank_lines", True): self._trim_segment_edge_blank_lines(seg)
-            for comp in seg:
-                if isinstance(comp, Plain) and comp.text:
-                    comp.text = comp.text.replace("__ZWSP_DOUBLE__", "\u200b \u200b").replace("__ZWSP_SINGLE__", "\u200b")
-                    # 后置清理
-                    if split_mode == "simple":
-                        for item in self._get_cfg("clean_after_items", []):
-                            if item: comp.text = comp.text.replace(item, "")
-                    else:
-                        regex = self._get_cfg("clean_after_regex", "")
-                        if regex: comp.text = re.sub(regex, "", comp.text, flags=re.DOTALL)
+        for seg in segments: self._postprocess_segment(seg, cfg)
+        timer.lap("post_clean")
+        timer.finish(len(segments), total_text_len)
 
-        if len(segments) <= 1 and not at_needs_proc:
-            final = segments[0] if segments else []
+        delivery_busy = cfg.async_delivery and self._delivery.is_busy(conv_key)
+        if len(segments) <= 1 and not at_needs_proc and not delivery_busy:
+            final = segments[0] if segments else Segment([])
             if enable_smart and not enable_reply: final = self._remove_reply_components(final)
-            result.chain.clear(); result.chain.extend(final); return
-
-        # --- 8. 发送 ---
-        for i in range(len(segments) - 1):
-            seg_chain = segments[i]
-            if i > 0 and enable_smart and not enable_reply: seg_chain = self._remove_reply_components(seg_chain)
-            text_content = "".join([c.text for c in seg_chain if isinstance(c, Plain)])
-            if not text_content.strip(" \t\r\n\u200b") and not any(not isinstance(c, Plain) for c in seg_chain): continue
-            
+            result.chain.clear(); result.chain.extend(final.materialize()); return
+
+        # --- 7. 发送 ---
+        if enable_smart and not enable_reply:
+            # 智能回复只作用于第一段；仅有一段时按最后一段处理
+            segments = [seg if i == 0 and len(segments) > 1 else self._remove_reply_components(seg) for i, seg in enumerate(segments)]
+
+        if cfg.async_delivery:
+            # 全部分段（含最后一段）交给后台按序发送，装饰阶段立即返回
+            tts_plans = await self._start_tts_prefetch(event, segments)
+            # 只有新的 LLM 回复才会打断旧回复，指令输出等非 LLM 回复照常排队
+            replace = cfg.new_reply_policy == "replace" and is_llm_reply
+            job = lambda is_stale: self._deliver_segments(event, segments, tts_plans, is_stale)
+            if self._delivery.submit(conv_key, job, replace=replace):
+                if enable_smart and source_id: self._mark_bot_reply(event, source_id)
+                result.chain.clear()
+                return
+
+        total = len(segments)
+        tts_plans = await self._start_tts_prefetch(event, segments[:-1])
+        for i in range(total - 1):
+            await self._send_segment(event, segments[i], i + 1, total, "主动发送", True, tts_plans[i])
+
+        if enable_smart and source_id: self._mark_bot_reply(event, source_id)
+
+        result.chain.clear(); result.chain.extend(segments[-1].materialize())
+
+    async def _enqueue_unsplit(self, event: AstrMessageEvent, result, cfg: SplitterSettings) -> None:
+        """
+        不分段的回复：该会话仍有分段在后台排队时，原样作为单段提交到同一队列，保证会话内的发送顺序；
+        否则不做处理，由框架直接发送。
+        """
+        conv_key = self._get_conversation_key(event)
+        if not cfg.async_delivery or not self._delivery.is_busy(conv_key): return
+        setattr(result, "__splitter_processed", True)
+        segment = Segment([(c.text, 0, len(c.text)) if isinstance(c, Plain) else c for c in result.chain])
+        segment.measure()
+        segments = [segment]
+        tts_plans = await self._start_tts_prefetch(event, segments)
+        job = lambda is_stale: self._deliver_segments(event, segments, tts_plans, is_stale)
+        # 不分段的回复只排在旧回复之后，不打断旧回复
+        if self._delivery.submit(conv_key, job): result.chain.clear()
+
+    async def _split_result(self, cfg: SplitterSettings, chain: List[BaseMessageComponent], total_text_len: int, timer) -> List[Segment]:
+        """前置清理、切分与合并，返回尚未后处理的分段；会原地改写 chain 中的文本。"""
+        max_segs = cfg.max_segments
+        balanced = cfg.balanced_split_mode and max_segs > 0
+
+        # --- 3. 分段前清理（零宽空格片段由切分逻辑整体保护，无需替换） ---
+        scans = None
+        if self._offloader.wants(total_text_len):
+            # 超长回复：清理与切分点扫描在线程池/进程池中完成，期间不阻塞其他对话
+            plains = [c for c in chain if isinstance(c, Plain) and c.text]
+            prepared = await self._offloader.run(
+                _prepare_texts, [c.text for c in plains], cfg.clean_before_re, cfg.split_re, cfg.enable_smart_split, balanced, cfg.protected,
+            )
+            scans = {}
+            for comp, (text, hard, soft) in zip(plains, prepared):
+                comp.text = text; scans[text] = (hard, soft)
+        else:
+            for comp in chain:
+                if isinstance(comp, Plain) and comp.text: comp.text = self._clean_before_text(comp.text, cfg)
+        timer.lap("pre_clean")
+
+        # --- 4. 执行切分（分段正则已在配置快照中预编译，不再单独计时） ---
+        if balanced:
+            # 均分模式直接求出不超过段数上限的最均匀切法
+            segments = self.split_chain_balanced(chain, cfg, scans)
+        else:
+            segments = self.split_chain_smart(chain, cfg, scans)
+        timer.lap("split")
+
+        # 强制分段上限控制：超出部分并入最后一段，相邻文本合并避免内部被打断
+        if max_segs > 0 and len(segments) > max_segs:
+            tail = [item for seg in segments[max_segs - 1:] for item in seg.items]
+            segments = segments[:max_segs - 1] + [Segment(_join_text_items(tail))]
+
+        # 未设段数上限的均分模式：尾部过短时并入上一段
+        if cfg.balanced_split_mode and max_segs <= 0 and len(segments) >= 2:
+            last = segments[-1]
+            if 0 < len(last.text().strip()) < cfg.min_segment_length:
+                if all(type(item) is tuple or isinstance(item, Reply) for item in last.items):
+                    segments[-2].items.extend(segments.pop().items)
+        timer.lap("merge")
+        return segments
+
+    async def _send_segment(self, event: AstrMessageEvent, segment: Segment, index: int, total: int, method: str, delay_after: bool, tts_plan: Optional[Dict[str, Any]] = None) -> None:
+        if segment.blank: return
+        metrics = self._metrics if self._metrics.enabled else None
+        try:
+            start = time.perf_counter()
+            seg_chain = await self._process_tts_for_segment(segment.materialize(), tts_plan)
+            if metrics and tts_plan: start = metrics.lap("tts", start)
+            self._log_segment(index, total, seg_chain, method)
+            mc = MessageChain(); mc.chain = seg_chain
+            await self._send_with_retry(event, mc)
+            if metrics:
+                start = metrics.lap("send", start)
+                metrics.record_send(event.unified_msg_origin, True)
+            if delay_after:
+                await asyncio.sleep(self.calculate_delay(segment.chars, self._settings_for(event)))
+                if metrics: metrics.lap("delay", start)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Splitter] 发送失败: {e}")
+            if metrics: metrics.record_send(event.unified_msg_origin, False)
+
+    def _rate_bucket_key(self, event: AstrMessageEvent) -> Tuple[str, str]:
+        platform_name = str(getattr(event, "get_platform_name", lambda: "")() or "")
+        self_id = str(getattr(event, "get_self_id", lambda: "")() or "")
+        return platform_name, self_id
+
+    async def _send_with_retry(self, event: AstrMessageEvent, mc: MessageChain) -> None:
+        """取得限速配额后发送；失败时按指数退避重试，重试耗尽后抛出最后一次的异常。"""
+        cfg = self.settings
+        bucket_key = self._rate_bucket_key(event)
+        umo = event.unified_msg_origin
+        for attempt in range(cfg.send_retry_times + 1):
+            waited = await self._rate_limiter.acquire(bucket_key, umo)
+            if waited and self._metrics.enabled: self._metrics.observe("rate_wait", waited)
             try:
-                seg_chain = await self._process_tts_for_segment(event, seg_chain)
-                self._log_segment(i + 1, len(segments), seg_chain, "主动发送")
-                mc = MessageChain(); mc.chain = seg_chain
-                await self.context.send_message(event.unified_msg_origin, mc)
-                await asyncio.sleep(self.calculate_delay(text_content))
+                async with self._delivery.slot():
+                    await self.context.send_message(umo, mc)
+                return
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"[Splitter] 发送失败: {e}")
+                if attempt >= cfg.send_retry_times: raise
+                backoff = cfg.send_retry_backoff * (2 ** attempt)
+                logger.warning("[Splitter] 发送失败，{:.1f} 秒后重试（{}/{}）: {}".format(backoff, attempt + 1, cfg.send_retry_times, e))
+                if self._metrics.enabled: self._metrics.send_retries += 1
+                await asyncio.sleep(backoff)
 
-        if enable_smart and source_id: self._mark_bot_reply(event, source_id)
+    async def _deliver_segments(self, event: AstrMessageEvent, segments: List[Segment], tts_plans: List[Optional[Dict[str, Any]]], is_stale: Callable[[], bool]) -> None:
+        total = len(segments)
+        for i, segment in enumerate(segments):
+            if is_stale():
+                logger.info("[Splitter] 会话有新回复，丢弃旧回复剩余 {} 段".format(total - i))
+                return
+            await self._send_segment(event, segment, i + 1, total, "后台发送", i < total - 1, tts_plans[i])
+
+    async def _split_stream(self, event: AstrMessageEvent, upstream):
+        """
+        包装框架的流式输出：文本增量送入 StreamingSplitter，确认完成的分段立即发送；
+        流结束后等待已发分段送达，再把剩余部分交还框架作为最后一条消息发送。
+        """
+        cfg = self._settings_for(event)
+        splitter = StreamingSplitter(cfg)
+        conv_key = self._get_conversation_key(event)
+        source_id = str(getattr(event.message_obj, "message_id", "") or "")
+        sent = 0
+
+        async def emit(seg: Segment) -> None:
+            nonlocal sent
+            self._postprocess_segment(seg, cfg)
+            if seg.blank: return
+            if not sent and source_id: self._attach_source_reply(event, seg, source_id)
+            sent += 1; index = sent
+            if cfg.async_delivery:
+                job = lambda is_stale: self._send_segment(event, seg, index, 0, "流式发送", True)
+                if self._delivery.submit(conv_key, job): return
+            await self._send_segment(event, seg, index, 0, "流式发送", False)
+
+        async for chunk in upstream:
+            comps = getattr(chunk, "chain", None) or []
+            if comps and all(isinstance(c, Plain) for c in comps):
+                for piece in splitter.feed("".join(c.text for c in comps)):
+                    await emit(Segment.of_text(piece))
+                continue
+            # 非文本片段：先发出之前已收到的文本，等已排队分段发完后再原样交给框架
+            for piece in splitter.finish(): await emit(Segment.of_text(piece))
+            await self._delivery.join(conv_key)
+            yield chunk
+
+        *tail, last = splitter.finish()
+        for piece in tail: await emit(Segment.of_text(piece))
+        rest = Segment.of_text(last)
+        self._postprocess_segment(rest, cfg)
+        if not sent and source_id: self._attach_source_reply(event, rest, source_id)
+        # 与整段切分一致：智能回复只保留在非末段的第一段上
+        if cfg.enable_smart_reply and not cfg.enable_reply: rest = self._remove_reply_components(rest)
+        if sent and cfg.enable_smart_reply and source_id: self._mark_bot_reply(event, source_id)
+        await self._delivery.join(conv_key)
+        if not rest.blank:
+            mc = MessageChain(); mc.chain = rest.materialize()
+            yield mc
+
+    async def terminate(self):
+        await self._delivery.close()
+        self._rate_limiter.close()
+        self._offloader.close()
+        if self._metrics.enabled: self._metrics.maybe_dump(force=True)
 
-        last_seg = segments[-1]
-        if enable_smart and not enable_reply: last_seg = self._remove_reply_components(last_seg)
-        result.chain.clear(); result.chain.extend(last_seg)
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("splitter_stats")
+    async def splitter_stats(self, event: AstrMessageEvent):
+        """查看分段各阶段耗时与发送统计"""
+        if not self._metrics.enabled:
+            lines = ["分段统计未开启，请在插件配置「高级设置」中打开「性能统计」。"]
+        else:
+            lines = [self._metrics.render_text(self._get_conversation_key(event))]
+        for name, reason in self._patterns.errors.items():
+            lines.append("配置项 {} 的正则不可用：{}".format(name, reason))
+        result = event.plain_result("\n".join(lines))
+        # 统计结果本身不参与分段
+        setattr(result, "__splitter_processed", True)
+        yield result
 
     def _log_segment(self, index: int, total: int, chain: List[BaseMessageComponent], method: str):
+        # 逐段日志仅在 DEBUG 级别输出，未开启时不拼接消息内容
+        if not logger.isEnabledFor(logging.DEBUG): return
         content = "".join([c.text if isinstance(c, Plain) else f"[{type(c).__name__}]" for c in chain])
-        logger.info("[Splitter] 第 {}/{} 段 ({}): {}".format(index, total, method, content.replace('\n', '\\n')))
+        logger.debug("[Splitter] 第 {}/{} 段 ({}): {}".format(index, total if total > 0 else "?", method, content.replace('\n', '\\n')))
 
-    def _trim_segment_edge_blank_lines(self, segment: List[BaseMessageComponent]) -> None:
-        f_p = next((c for c in segment if isinstance(c, Plain)), None)
-        l_p = next((c for c in reversed(segment) if isinstance(c, Plain)), None)
-        if f_p and f_p.text: f_p.text = re.sub(r'^(?:[ \t]*\r?\n)+', '', f_p.text)
-        if l_p and l_p.text: l_p.text = re.sub(r'(?:\r?\n[ \t]*)+$', '', l_p.text)
+    def _clean_before_text(self, text: str, cfg: SplitterSettings) -> str:
+        clean_re = cfg.clean_before_re
+        return clean_re.sub("", text) if clean_re is not None else text
 
-    async def _process_tts_for_segment(self, event: AstrMessageEvent, segment: List[BaseMessageComponent]) -> List[BaseMessageComponent]:
-        if not self._get_cfg("enable_tts_for_segments", True): return segment
+    def _postprocess_segment(self, segment: Segment, cfg: SplitterSettings) -> None:
+        """分段后处理：清理首尾空行并执行后置清理，最后统计段长与是否为空段。"""
+        if cfg.trim_segment_edge_blank_lines: self._trim_segment_edge_blank_lines(segment)
+        clean_re = cfg.clean_after_re
+        if clean_re is not None:
+            items = segment.items
+            for k, item in enumerate(items):
+                if type(item) is tuple and item[1] < item[2]:
+                    text = clean_re.sub("", item[0][item[1]:item[2]])
+                    items[k] = (text, 0, len(text))
+        segment.measure()
+
+    def _trim_segment_edge_blank_lines(self, segment: Segment) -> None:
+        items = segment.items
+        texts = [k for k, item in enumerate(items) if type(item) is tuple]
+        if not texts: return
+        src, start, end = items[texts[0]]
+        m = _LEADING_BLANK_LINES_RE.match(src, start, end) if start < end else None
+        if m: items[texts[0]] = (src, m.end(), end)
+        src, start, end = items[texts[-1]]
+        cut = _trailing_blank_start(src, start, end)
+        if cut < end: items[texts[-1]] = (src, start, cut)
+
+    async def _start_tts_prefetch(self, event: AstrMessageEvent, segments: List[Segment]) -> List[Optional[Dict[str, Any]]]:
+        """
+        为即将发送的各段并发启动 TTS 合成，返回每段的合成计划
+        （tasks 为“组件下标 -> 合成任务”）。未启用或本段未触发 TTS 时为 None。
+        """
+        none = [None] * len(segments)
+        if not self._settings_for(event).enable_tts_for_segments: return none
         try:
             all_cfg = self.context.get_config(event.unified_msg_origin)
             tts_cfg = all_cfg.get("provider_tts_settings", {})
-            if not tts_cfg.get("enable", False): return segment
+            if not tts_cfg.get("enable", False): return none
             tts_prov = self.context.get_using_tts_provider(event.unified_msg_origin)
-            if not tts_prov or not await SessionServiceManager.should_process_tts_request(event): return segment
-            if random.random() > float(tts_cfg.get("trigger_probability", 1.0)): return segment
-            dual = tts_cfg.get("dual_output", False)
-            new_seg = []
-            for comp in segment:
-                if isinstance(comp, Plain) and len(comp.text) > 1:
-                    try:
-                        path = await tts_prov.get_audio(comp.text)
-                        if path:
-                            new_seg.append(Record(file=path, url=path))
-                            if dual: new_seg.append(comp)
-                        else: new_seg.append(comp)
-                    except: new_seg.append(comp)
-                else: new_seg.append(comp)
-            return new_seg
-        except: return segment
-
-    def calculate_delay(self, text: str) -> float:
-        strategy = self._get_cfg("delay_strategy", "linear")
-        if strategy == "random": return random.uniform(self._get_cfg("random_min", 1.0), self._get_cfg("random_max", 3.0))
-        if strategy == "log": return min(self._get_cfg("log_base", 0.5) + self._get_cfg("log_factor", 0.8) * math.log(len(text) + 1), 5.0)
-        if strategy == "linear": return self._get_cfg("linear_base", 0.5) + (len(text) * self._get_cfg("linear_factor", 0.1))
-        return self._get_cfg("fixed_delay", 1.5)
-
-    def split_chain_smart(self, chain: List[BaseMessageComponent], pattern: str, smart: bool, strategies: Dict[str, str], enable_reply: bool, ideal: int = 0) -> List[List[BaseMessageComponent]]:
-        segments = []; buffer = []; weight = 0
+            if not tts_prov or not await SessionServiceManager.should_process_tts_request(event): return none
+            probability = float(tts_cfg.get("trigger_probability", 1.0))
+            dual = bool(tts_cfg.get("dual_output", False))
+        except Exception:
+            return none
+
+        prov_key = str((getattr(tts_prov, "provider_config", None) or {}).get("id") or id(tts_prov))
+        plans = []
+        for seg in segments:
+            if seg.blank or random.random() > probability:
+                plans.append(None); continue
+            tasks = {}
+            # 组件下标与发送时 materialize() 的结果一一对应
+            for idx, item in enumerate(seg.items):
+                if type(item) is tuple and item[2] - item[1] > 1:
+                    tasks[idx] = self._synthesize(tts_prov, prov_key, item[0][item[1]:item[2]])
+            plans.append({"dual": dual, "tasks": tasks} if tasks else None)
+        return plans
+
+    def _synthesize(self, tts_prov, prov_key: str, text: str) -> asyncio.Task:
+        key = (prov_key, text)
+        task = self._tts_cache.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run_tts(tts_prov, text))
+            self._tts_cache.put(key, task)
+        return task
+
+    async def _run_tts(self, tts_prov, text: str) -> Optional[str]:
+        async with self._tts_slots:
+            return await tts_prov.get_audio(text)
+
+    async def _process_tts_for_segment(self, segment: List[BaseMessageComponent], plan: Optional[Dict[str, Any]]) -> List[BaseMessageComponent]:
+        if not plan: return segment
+        new_seg = []
+        for idx, comp in enumerate(segment):
+            task = plan["tasks"].get(idx)
+            if task is None:
+                new_seg.append(comp); continue
+            try:
+                path = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                path = None
+            if path:
+                new_seg.append(Record(file=path, url=path))
+                if plan["dual"]: new_seg.append(comp)
+            else: new_seg.append(comp)
+        return new_seg
+
+    def calculate_delay(self, length: int, cfg: SplitterSettings) -> float:
+        """按段落文本长度（字符数）计算发送后的等待时间。"""
+        strategy = cfg.delay_strategy
+        if strategy == "random": return random.uniform(cfg.random_min, cfg.random_max)
+        if strategy == "log": return min(cfg.log_base + cfg.log_factor * math.log(length + 1), 5.0)
+        if strategy == "linear": return cfg.linear_base + (length * cfg.linear_factor)
+        return cfg.fixed_delay
+
+    def split_chain_smart(self, chain: List[BaseMessageComponent], cfg: SplitterSettings, scans: Optional[Mapping[str, Tuple[List[int], Optional[List[int]]]]] = None) -> List[Segment]:
+        """
+        按切分点与组件策略切分消息链；文本只记录区间，每段的条目列表直接移交给 Segment，不复制。
+        scans 为已在池中算好的 文本 -> (切分点, 次级切分点)，未命中的文本当场扫描。
+        """
+        pattern = cfg.split_re; smart = cfg.enable_smart_split; strategies = cfg.strategies
+        keep_reply = cfg.enable_reply or cfg.enable_smart_reply
+        segments: List[Segment] = []; buffer = []
         for comp in chain:
             if isinstance(comp, Plain):
-                if not comp.text: continue
-                if not smart: self._process_text_simple(comp.text, pattern, segments, buffer); weight = 0
-                else: weight = self._process_text_smart(comp.text, pattern, segments, buffer, weight, ideal)
+                text = comp.text
+                if not text: continue
+                last = 0; scan = scans.get(text) if scans else None
+                if scan is not None: cuts = scan[0]
+                else: cuts = _scan_smart_cuts(text, pattern, protected=cfg.protected) if smart else _delimiter_cuts(pattern, text)
+                for end in cuts:
+                    buffer.append((text, last, end))
+                    segments.append(Segment(buffer)); buffer = []; last = end
+                if last < len(text): buffer.append((text, last, len(text)))
             else:
                 c_type = type(comp).__name__.lower()
                 if "reply" in c_type:
-                    if enable_reply or self._get_cfg("enable_smart_reply", False): buffer.append(comp)
+                    if keep_reply: buffer.append(comp)
                     continue
                 strategy = strategies.get(c_type, strategies.get("default", "跟随下段"))
                 if strategy == "单独":
-                    if buffer: segments.append(buffer[:]); buffer.clear()
-                    segments.append([comp]); weight = 0
+                    if buffer: segments.append(Segment(buffer)); buffer = []
+                    segments.append(Segment([comp]))
                 elif strategy == "跟随上段":
-                    if buffer: buffer.append(comp); segments.append(buffer[:]); buffer.clear(); weight = 0
-                    elif segments: segments[-1].append(comp)
-                    else: segments.append([comp])
+                    if buffer: buffer.append(comp); segments.append(Segment(buffer)); buffer = []
+                    elif segments: segments[-1].items.append(comp)
+                    else: segments.append(Segment([comp]))
                 elif strategy in ["跟随下段", "接下文"]:
-                    if buffer: segments.append(buffer[:]); buffer.clear(); weight = 0
+                    if buffer: segments.append(Segment(buffer)); buffer = []
                     buffer.append(comp)
                 else: buffer.append(comp)
-        if buffer: segments.append(buffer)
-        return [s for s in segments if s]
-
-    def _process_text_simple(self, text: str, pattern: str, segments: list, buffer: list):
-        parts = re.split("({})".format(pattern), text)
-        tmp = ""
-        for p in parts:
-            if not p: continue
-            if re.fullmatch(pattern, p):
-                tmp += p; buffer.append(Plain(tmp))
-                segments.append(buffer[:]); buffer.clear(); tmp = ""
-            else: tmp += p
-        if tmp: buffer.append(Plain(tmp))
-
-    def _process_text_smart(self, text: str, pattern: str, segments: list, buffer: list, start_w: int = 0, ideal: int = 0) -> int:
-        stack = []; compiled = re.compile(pattern); i = 0; n = len(text); chunk = ""; weight = start_w
-        ratio_min = self._get_cfg("balanced_split_ratio_min", 0.4)
-        ratio_max = self._get_cfg("balanced_split_ratio_max", 0.9)
-        
-        while i < n:
-            if text.startswith("```", i):
-                idx = text.find("```", i + 3)
-                if idx != -1: chunk += text[i:idx+3]; weight += idx+3-i; i = idx+3; continue
-                else: chunk += text[i:]; weight += n-i; break
-            if text.startswith("<think>", i):
-                idx = text.find("</think>", i + 7)
-                if idx != -1: chunk += text[i:idx+8]; weight += idx+8-i; i = idx+8; continue
-                else: chunk += text[i:]; weight += n-i; break
-
-            match = compiled.match(text, pos=i)
-            if match:
-                delim = match.group(); should = False
-                if not stack or "\n" in delim:
-                    should = True
-                    if ideal > 0 and weight < ideal * ratio_min: should = False
-                    if should and "\n" not in delim and re.match(r"^[ \t.?!,;:\-']+$", delim):
-                        p_c = text[i-1] if i > 0 else ""; n_c = text[i+len(delim)] if i+len(delim) < n else ""
-                        if re.match(r"^[a-zA-Z0-9 \t.?!,;:\-']$", p_c) and re.match(r"^[a-zA-Z0-9 \t.?!,;:\-']$", n_c): should = False
-                if should:
-                    chunk += delim; buffer.append(Plain(chunk))
-                    segments.append(buffer[:]); buffer.clear(); chunk = ""; weight = 0; i += len(delim)
-                else: chunk += delim; weight += len(delim); i += len(delim)
+        if buffer: segments.append(Segment(buffer))
+        return segments
+
+    def split_chain_balanced(self, chain: List[BaseMessageComponent], cfg: SplitterSettings, scans: Optional[Mapping[str, Tuple[List[int], Optional[List[int]]]]] = None) -> List[Segment]:
+        """
+        智能均分：按组件策略划出必须断开的块，在各块内一次扫描收集全部合法切分点
+        （主分隔符与次级标点，避开成对符号与受保护区间），再在不超过 max_segs 段的前提下
+        选出各段长度最均匀的切法。结果即最终分段，无需事后合并。scans 同 split_chain_smart。
+        """
+        pattern = cfg.split_re; smart = cfg.enable_smart_split; strategies = cfg.strategies; max_segs = cfg.max_segments
+        # 1. 组件策略决定的块：单独发送的组件自成一块（不参与均分），其余块内可自由切分；文本以区间记录
+        blocks: List[list] = []; solo: List[bool] = []; buffer = []
+        for comp in chain:
+            if isinstance(comp, Plain):
+                if comp.text: buffer.append((comp.text, 0, len(comp.text)))
                 continue
+            c_type = type(comp).__name__.lower()
+            if "reply" in c_type:
+                if cfg.enable_reply or cfg.enable_smart_reply: buffer.append(comp)
+                continue
+            strategy = strategies.get(c_type, strategies.get("default", "跟随下段"))
+            if strategy == "单独":
+                if buffer: blocks.append(buffer); solo.append(False); buffer = []
+                blocks.append([comp]); solo.append(True)
+            elif strategy == "跟随上段":
+                if buffer: buffer.append(comp); blocks.append(buffer); solo.append(False); buffer = []
+                elif blocks: blocks[-1].append(comp)
+                else: blocks.append([comp]); solo.append(False)
+            elif strategy in ["跟随下段", "接下文"]:
+                if buffer: blocks.append(buffer); solo.append(False); buffer = []
+                buffer.append(comp)
+            else: buffer.append(comp)
+        if buffer: blocks.append(buffer); solo.append(False)
+        if not blocks: return []
+        if len(blocks) > max_segs:
+            # 强制断开的块已超过段数上限：超出部分并入最后一段，相邻文本合并避免被打断
+            tail = _join_text_items([item for b in blocks[max_segs - 1:] for item in b])
+            blocks = blocks[:max_segs - 1] + [tail]; solo = solo[:max_segs - 1] + [False]
 
-            if ideal > 0 and weight >= ideal * ratio_max and not stack:
-                sec = self.secondary_pattern.match(text, pos=i)
-                if sec:
-                    delim = sec.group()
-                    chunk += delim; buffer.append(Plain(chunk))
-                    segments.append(buffer[:]); buffer.clear(); chunk = ""; weight = 0; i += len(delim)
-                    continue
+        # 2. 各文本块的候选切分点：所在组件下标、文本下标、是否次级标点，以及切分点之前的累计权重
+        blocks_cands = []; totals = []
+        for block, is_solo in zip(blocks, solo):
+            comps: List[int] = []; offsets: List[int] = []; soft_flags: List[bool] = []; ws: List[int] = []; base = 0
+            if not is_solo:
+                last_plain = max((k for k, item in enumerate(block) if type(item) is tuple), default=-1)
+                for k, item in enumerate(block):
+                    if type(item) is not tuple: continue
+                    text = item[0][item[1]:item[2]]
+                    scan = scans.get(text) if scans else None
+                    if smart:
+                        if scan is not None: hard, soft = scan[0], scan[1] or []
+                        else: soft = []; hard = _scan_smart_cuts(text, pattern, soft=soft, protected=cfg.protected)
+                        points = sorted([(c, False) for c in hard] + [(c, True) for c in set(soft).difference(hard)])
+                        cuts = [c for c, _ in points]; flags = [f for _, f in points]
+                    else:
+                        cuts = list(scan[0]) if scan is not None else _delimiter_cuts(pattern, text); flags = [False] * len(cuts)
+                    cuts.append(len(text))
+                    prefix = _nonspace_prefix(text, cuts)
+                    # 块内最后一段文本末尾的切分点没有意义（其后已是块边界）
+                    usable = len(cuts) - 1
+                    if k == last_plain and usable and cuts[usable - 1] >= len(text): usable -= 1
+                    comps.extend([k] * usable); offsets.extend(cuts[:usable]); soft_flags.extend(flags[:usable])
+                    ws.extend([base + w for w in prefix[:usable]])
+                    base += prefix[-1]
+            blocks_cands.append((comps, offsets, soft_flags, ws)); totals.append(base)
+
+        # 3. 理想段长与各块在不同段数下的最优切法
+        ideal = sum(totals) / max(1, max_segs - sum(solo))
+        min_weight = max(cfg.min_segment_length, ideal * cfg.balanced_split_ratio_min)
+        # 次级标点切分的额外代价：上限比越大，越只在段落明显过长时才用逗号等切分
+        penalty = (ideal * max(0.0, cfg.balanced_split_ratio_max) / 2) ** 2
+        budget = max_segs - len(blocks) + 1
+        jobs = []
+        for (comps, _, soft_flags, ws), total in zip(blocks_cands, totals):
+            if not ws: jobs.append(None); continue
+            # 除整段不切外每段不少于 min_weight，段数不会超过 total / min_weight
+            parts = min(budget, len(ws) + 1, int(total // min_weight) if min_weight > 0 else budget)
+            jobs.append((ws, soft_flags, total, ideal, min_weight, max(1, parts), penalty))
+        # 候选点较多时，先用就近切分的可行解给出总代价上界，缩小各块 DP 的搜索窗口
+        bound = float("inf")
+        if sum(len(job[0]) for job in jobs if job) > 64:
+            greedy = []
+            for job in jobs:
+                if not job: greedy.append([0.0]); continue
+                ws, soft_flags, total, _, _, parts, _ = job
+                # 每块按其权重占比取段数，再与不切的代价一起参与分配，保证总能得到可行解
+                m = min(parts, max(1, round(total / ideal)))
+                costs = [(total - ideal) ** 2] + [float("inf")] * (parts - 1)
+                if m > 1: costs[m - 1] = _greedy_partition_cost(ws, soft_flags, total, ideal, min_weight, m, penalty)
+                greedy.append(costs)
+            bound = _allocate_parts(greedy, max_segs)[0]
+        options = [_balanced_partition(*job, bound) if job else [(0.0, [])] for job in jobs]
+
+        # 4. 在段数上限内分配各块的段数（每块至少一段）
+        counts = _allocate_parts([[c for c, _ in opts] for opts in options], max_segs)[1]
 
-            char = text[i]
-            if char in self.quote_chars:
-                if stack and stack[-1] == char: stack.pop()
-                else: stack.append(char)
-            elif not stack and char in self.pair_map: stack.append(char)
-            elif stack and char == self.pair_map.get(stack[-1]): stack.pop()
-            
-            chunk += char; i += 1; weight += 1 if not char.isspace() else 0
-        if chunk: buffer.append(Plain(chunk))
-        return weight
+        # 5. 按选中的切分点切出各段
+        segments: List[Segment] = []
+        for block, (comps, offsets, _, _), opts, m in zip(blocks, blocks_cands, options, counts):
+            by_comp: Dict[int, List[int]] = {}
+            for idx in opts[m - 1][1]: by_comp.setdefault(comps[idx], []).append(offsets[idx])
+            current = []
+            for k, item in enumerate(block):
+                cut_at = by_comp.get(k)
+                if not cut_at:
+                    current.append(item); continue
+                text = item[0][item[1]:item[2]]; last = 0
+                for offset in cut_at:
+                    current.append((text, last, offset)); segments.append(Segment(current)); current = []; last = offset
+                if last < len(text): current.append((text, last, len(text)))
+            if current: segments.append(Segment(current))
+        return segments